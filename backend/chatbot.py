@@ -2,10 +2,16 @@ import google.generativeai as genai
 import os
 import re
 import time
+import asyncio
+import threading
+import difflib
+from collections import OrderedDict
 from dotenv import load_dotenv
 from sqlalchemy.orm import Session
 from sqlalchemy import func
 import models
+import crud
+import product_search
 
 # Load environment variables from .env file
 env_path = os.path.join(os.path.dirname(__file__), '.env')
@@ -25,74 +31,100 @@ STORE_INFO = {
     "description": "Your trusted online store for smart tech products"
 }
 
-def get_chat_response(db: Session, user_message: str) -> str:
+# Product search index, rebuilt when crud.content_version() moves on.
+# The max age only catches writes made by other processes (e.g. other workers).
+CATALOG_CONTEXT_MAX_AGE = float(os.getenv("CHAT_CATALOG_MAX_AGE", "300"))
+CATALOG_TOP_K = int(os.getenv("CHAT_CATALOG_TOP_K", "8"))
+_catalog_index = {"version": None, "built_at": 0.0, "index": None}
+_catalog_lock = threading.Lock()
+
+def get_catalog_index(db: Session) -> product_search.ProductIndex:
     """
-    Enhanced chatbot with better error handling, retry logic, and optimized context.
+    Retrieval index over the product catalog, cached until a product changes
+    or goes in or out of stock
     """
-    if not GOOGLE_API_KEY:
-        return "I am an AI assistant, but my brain (API Key) is missing. Please tell the admin to configure the GEMINI_API_KEY."
+    version = crud.content_version()
+    with _catalog_lock:
+        if (_catalog_index["version"] == version
+                and time.monotonic() - _catalog_index["built_at"] < CATALOG_CONTEXT_MAX_AGE):
+            return _catalog_index["index"]
+    
+    products = db.query(
+        models.Product.name, models.Product.price, models.Product.category,
+        models.Product.stock_quantity, models.Product.description
+    ).order_by(models.Product.id).all()
+    index = product_search.ProductIndex(products)
+    
+    with _catalog_lock:
+        # A write during the rebuild may not be reflected; leave the next message to rebuild
+        if version == crud.content_version():
+            _catalog_index.update(version=version, built_at=time.monotonic(), index=index)
+    return index
 
-    # Retry logic with exponential backoff
-    max_retries = 3
-    retry_delay = 1  # seconds
+def get_catalog_context(db: Session, user_message: str) -> str:
+    """
+    Product block for the system prompt: catalog summary plus the products most relevant to the message
+    """
+    return get_catalog_index(db).context(user_message, CATALOG_TOP_K)
+
+# Words that pull the recent orders into the prompt. "delivery" and "status"
+# are left out: they mostly come with policy questions, which stay cacheable.
+ORDER_KEYWORDS = ["ORDER", "TRACKING", "SHIPMENT"]
+ORDER_ID_PATTERN = re.compile(r'ORD-(\d+)')
+
+def is_order_query(user_message: str) -> bool:
+    """Whether build_system_prompt puts live order data into the prompt for this message"""
+    user_message_upper = user_message.upper()
+    return (ORDER_ID_PATTERN.search(user_message_upper) is not None
+            or any(keyword in user_message_upper for keyword in ORDER_KEYWORDS))
+
+def build_system_prompt(db: Session, user_message: str) -> str:
+    """
+    System prompt with store info, the relevant products and any order details the message asks about
+    """
+    # 1. Product Context (retrieved from the cached catalog index)
+    product_context = get_catalog_context(db, user_message)
+
+    # 2. Build Order Context (Only if needed - Optimized)
+    order_context = ""
+    user_message_upper = user_message.upper()
     
-    for attempt in range(max_retries):
-        try:
-            # 1. Build Product Context (Optimized)
-            products = db.query(models.Product).all()
+    # Check if user is asking about orders
+    if is_order_query(user_message):
+        # Extract specific order ID if mentioned
+        order_match = ORDER_ID_PATTERN.search(user_message_upper)
+        
+        if order_match:
+            # User asked about specific order
+            order_num = int(order_match.group(1))
+            specific_order = db.query(models.Order).filter(models.Order.id == order_num).first()
             
-            if not products:
-                product_context = "No products available at the moment.\n"
+            if specific_order:
+                order_id = f"ORD-{str(specific_order.id).zfill(4)}"
+                order_context = f"\n**📦 Order Details for {order_id}:**\n"
+                order_context += f"• Status: {specific_order.status.upper()}\n"
+                order_context += f"• Customer: {specific_order.customer_name}\n"
+                order_context += f"• Email: {specific_order.customer_email}\n"
+                order_context += f"• Shipping Address: {specific_order.shipping_address}\n"
+                order_context += f"• Total Amount: ${specific_order.total_amount}\n"
+                order_context += f"• Order Date: {specific_order.created_at.strftime('%Y-%m-%d %H:%M')}\n"
+                order_context += f"• Items Ordered:\n"
+                for item in specific_order.items:
+                    product_name = item.product.name if item.product else "Unknown Product"
+                    order_context += f"  - {product_name} x{item.quantity} @ ${item.price_at_purchase}\n"
             else:
-                product_context = "**Available Products:**\n"
-                for p in products:
-                    status = "✅ In Stock" if p.stock_quantity > 0 else "❌ Out of Stock"
-                    product_context += f"• {p.name} - ${p.price} | Category: {p.category} | {status}\n"
-                    product_context += f"  Description: {p.description}\n"
-
-            # 2. Build Order Context (Only if needed - Optimized)
-            order_context = ""
-            user_message_upper = user_message.upper()
-            
-            # Check if user is asking about orders
-            order_keywords = ["ORDER", "ORD-", "STATUS", "DELIVERY", "TRACKING", "SHIPMENT"]
-            is_order_query = any(keyword in user_message_upper for keyword in order_keywords)
-            
-            if is_order_query:
-                # Extract specific order ID if mentioned
-                order_match = re.search(r'ORD-(\d+)', user_message_upper)
-                
-                if order_match:
-                    # User asked about specific order
-                    order_num = int(order_match.group(1))
-                    specific_order = db.query(models.Order).filter(models.Order.id == order_num).first()
-                    
-                    if specific_order:
-                        order_id = f"ORD-{str(specific_order.id).zfill(4)}"
-                        order_context = f"\n**📦 Order Details for {order_id}:**\n"
-                        order_context += f"• Status: {specific_order.status.upper()}\n"
-                        order_context += f"• Customer: {specific_order.customer_name}\n"
-                        order_context += f"• Email: {specific_order.customer_email}\n"
-                        order_context += f"• Shipping Address: {specific_order.shipping_address}\n"
-                        order_context += f"• Total Amount: ${specific_order.total_amount}\n"
-                        order_context += f"• Order Date: {specific_order.created_at.strftime('%Y-%m-%d %H:%M')}\n"
-                        order_context += f"• Items Ordered:\n"
-                        for item in specific_order.items:
-                            product_name = item.product.name if item.product else "Unknown Product"
-                            order_context += f"  - {product_name} x{item.quantity} @ ${item.price_at_purchase}\n"
-                    else:
-                        order_context = f"\n⚠️ Order ORD-{str(order_num).zfill(4)} not found in database.\n"
-                else:
-                    # General order query - show recent orders (limit to 10 for efficiency)
-                    recent_orders = db.query(models.Order).order_by(models.Order.created_at.desc()).limit(10).all()
-                    if recent_orders:
-                        order_context = "\n**📦 Recent Orders:**\n"
-                        for o in recent_orders:
-                            order_id = f"ORD-{str(o.id).zfill(4)}"
-                            order_context += f"• {order_id} - {o.status.upper()} | Customer: {o.customer_name} | ${o.total_amount}\n"
-
-            # 3. Construct Optimized System Prompt
-            system_prompt = f"""You are a helpful AI Sales Assistant for {STORE_INFO['name']}, an e-commerce store.
+                order_context = f"\n⚠️ Order ORD-{str(order_num).zfill(4)} not found in database.\n"
+        else:
+            # General order query - show recent orders (limit to 10 for efficiency)
+            recent_orders = db.query(models.Order).order_by(models.Order.created_at.desc()).limit(10).all()
+            if recent_orders:
+                order_context = "\n**📦 Recent Orders:**\n"
+                for o in recent_orders:
+                    order_id = f"ORD-{str(o.id).zfill(4)}"
+                    order_context += f"• {order_id} - {o.status.upper()} | Customer: {o.customer_name} | ${o.total_amount}\n"
+
+    # 3. Construct Optimized System Prompt
+    system_prompt = f"""You are a helpful AI Sales Assistant for {STORE_INFO['name']}, an e-commerce store.
 
 **STORE INFORMATION:**
 • Store Name: {STORE_INFO['name']}
@@ -133,7 +165,7 @@ def get_chat_response(db: Session, user_message: str) -> str:
 • Use emojis occasionally for better engagement
 • If asked about order status, check the order information above
 • If order not found, say: "Order nahi mila. Please verify Order ID ya contact support."
-• For product price ranges, calculate from available products
+• For product price ranges, use the catalog summary
 • Match user's language (English or Roman Urdu)
 • If unsure, say: "Main sure nahi hoon. Please contact {STORE_INFO['contact']} for details."
 
@@ -148,63 +180,241 @@ User: "ORD-0011 ka status?"
 You: [Check order info above and provide status]
 
 Now answer this query: {user_message}"""
+    return system_prompt
 
-            # 4. Configure Safety Settings for Better Reliability
-            safety_settings = [
-                {
-                    "category": "HARM_CATEGORY_HARASSMENT",
-                    "threshold": "BLOCK_NONE"
-                },
-                {
-                    "category": "HARM_CATEGORY_HATE_SPEECH",
-                    "threshold": "BLOCK_NONE"
-                },
-                {
-                    "category": "HARM_CATEGORY_SEXUALLY_EXPLICIT",
-                    "threshold": "BLOCK_NONE"
-                },
-                {
-                    "category": "HARM_CATEGORY_DANGEROUS_CONTENT",
-                    "threshold": "BLOCK_NONE"
-                }
-            ]
-
-            # 5. Call Gemini API with configuration
-            generation_config = {
-                "temperature": 0.7,
-                "top_p": 0.95,
-                "top_k": 40,
-                "max_output_tokens": 500,
-            }
-            
-            model = genai.GenerativeModel(
-                model_name='gemini-2.5-flash',
-                generation_config=generation_config,
-                safety_settings=safety_settings
-            )
-            
-            response = model.generate_content(system_prompt)
+# Gemini settings; the model client is created once (init_model) and shared by all requests
+MODEL_NAME = 'gemini-2.5-flash'
+SAFETY_SETTINGS = [
+    {
+        "category": "HARM_CATEGORY_HARASSMENT",
+        "threshold": "BLOCK_NONE"
+    },
+    {
+        "category": "HARM_CATEGORY_HATE_SPEECH",
+        "threshold": "BLOCK_NONE"
+    },
+    {
+        "category": "HARM_CATEGORY_SEXUALLY_EXPLICIT",
+        "threshold": "BLOCK_NONE"
+    },
+    {
+        "category": "HARM_CATEGORY_DANGEROUS_CONTENT",
+        "threshold": "BLOCK_NONE"
+    }
+]
+GENERATION_CONFIG = {
+    "temperature": 0.7,
+    "top_p": 0.95,
+    "top_k": 40,
+    "max_output_tokens": 500,
+}
+
+MISSING_KEY_REPLY = "I am an AI assistant, but my brain (API Key) is missing. Please tell the admin to configure the GEMINI_API_KEY."
+NO_ANSWER_REPLY = "Sorry, main abhi soch nahi pa raha. Please thodi der baad try karein. 🤖"
+TECHNICAL_ISSUE_REPLY = f"Sorry, main abhi kuch technical issue face kar raha hoon. Please {STORE_INFO['contact']} par contact karein. 🤖"
+
+# Bound concurrent LLM calls and the time one request may spend on a call
+MAX_CONCURRENT_REQUESTS = int(os.getenv("CHAT_MAX_CONCURRENCY", "4"))
+REQUEST_TIMEOUT = float(os.getenv("CHAT_TIMEOUT", "30"))
+
+_model = None
+_limiter = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
+
+def init_model():
+    """
+    Create the shared Gemini model client (no-op without an API key or when a model is already set)
+    """
+    global _model
+    if _model is None and GOOGLE_API_KEY:
+        _model = genai.GenerativeModel(
+            model_name=MODEL_NAME,
+            generation_config=GENERATION_CONFIG,
+            safety_settings=SAFETY_SETTINGS
+        )
+    return _model
+
+def set_model(model):
+    """
+    Replace the model client, e.g. with a local fake that implements
+    async generate_content_async(prompt, stream=False) -> object with .text,
+    or with stream=True an async iterable of such chunks
+    """
+    global _model
+    _model = model
+
+# Replies to repeated questions, keyed on (content version, normalized message).
+# Order questions are never cached: their replies depend on live order data.
+RESPONSE_CACHE_SIZE = int(os.getenv("CHAT_CACHE_SIZE", "512"))
+RESPONSE_CACHE_TTL = float(os.getenv("CHAT_CACHE_TTL", "600"))
+# Similarity for a near match; 0 = exact only. Messages whose numbers or
+# alphanumeric tokens (prices, models like s24) differ never match.
+RESPONSE_CACHE_FUZZY = float(os.getenv("CHAT_CACHE_FUZZY", "0"))
+_response_cache = OrderedDict()  # (version, normalized message) -> (expires_at, reply)
+_response_cache_lock = threading.Lock()
+
+def normalize_message(message: str) -> str:
+    return " ".join(re.findall(r"\w+", message.lower()))
+
+def _cache_key(user_message: str):
+    """Response cache key for a message, or None when it must not be cached"""
+    if is_order_query(user_message):
+        return None
+    normalized = normalize_message(user_message)
+    return (crud.content_version(), normalized) if normalized else None
+
+def _specific_tokens(normalized: str) -> set:
+    """Tokens containing a digit, e.g. '600', 's24', '15'"""
+    return {token for token in normalized.split() if any(ch.isdigit() for ch in token)}
+
+def get_cached_reply(user_message: str):
+    key = _cache_key(user_message)
+    if key is None:
+        return None
+    now = time.monotonic()
+    with _response_cache_lock:
+        entry = _response_cache.get(key)
+        if entry is None and RESPONSE_CACHE_FUZZY > 0:
+            # Nearest cached question for the same content version
+            best = RESPONSE_CACHE_FUZZY
+            matcher = difflib.SequenceMatcher(b=key[1])
+            specific = _specific_tokens(key[1])
+            for cached_key in _response_cache:
+                if cached_key[0] != key[0] or _specific_tokens(cached_key[1]) != specific:
+                    continue
+                matcher.set_seq1(cached_key[1])
+                if matcher.real_quick_ratio() >= best and matcher.quick_ratio() >= best:
+                    ratio = matcher.ratio()
+                    if ratio >= best:
+                        best, entry, key = ratio, _response_cache[cached_key], cached_key
+        if entry is None:
+            return None
+        if entry[0] < now:
+            del _response_cache[key]
+            return None
+        _response_cache.move_to_end(key)
+        return entry[1]
+
+def cache_reply(user_message: str, reply: str):
+    key = _cache_key(user_message)
+    if key is None or not reply:
+        return
+    with _response_cache_lock:
+        _response_cache[key] = (time.monotonic() + RESPONSE_CACHE_TTL, reply)
+        _response_cache.move_to_end(key)
+        while len(_response_cache) > RESPONSE_CACHE_SIZE:
+            _response_cache.popitem(last=False)
+
+async def get_chat_response(db: Session, user_message: str) -> str:
+    """
+    Enhanced chatbot with better error handling, retry logic, and optimized context.
+    Awaits the model without blocking the event loop: backoff uses asyncio.sleep
+    and calls are limited to MAX_CONCURRENT_REQUESTS with a REQUEST_TIMEOUT each.
+    """
+    model = init_model()
+    if model is None:
+        return MISSING_KEY_REPLY
+
+    cached = get_cached_reply(user_message)
+    if cached is not None:
+        return cached
+
+    try:
+        # Database work runs in a worker thread, off the event loop
+        system_prompt = await asyncio.to_thread(build_system_prompt, db, user_message)
+    except Exception as e:
+        print(f"Chat prompt error: {e}")
+        return TECHNICAL_ISSUE_REPLY
+
+    # Retry logic with exponential backoff
+    max_retries = 3
+    retry_delay = 1  # seconds
+    
+    for attempt in range(max_retries):
+        try:
+            async with _limiter:
+                response = await asyncio.wait_for(model.generate_content_async(system_prompt), REQUEST_TIMEOUT)
             
             # Check if response was blocked
             if not response.text:
                 if attempt < max_retries - 1:
-                    time.sleep(retry_delay)
+                    await asyncio.sleep(retry_delay)
                     retry_delay *= 2  # Exponential backoff
                     continue
-                return "Sorry, main abhi soch nahi pa raha. Please thodi der baad try karein. 🤖"
+                return NO_ANSWER_REPLY
             
-            return response.text.strip()
+            reply = response.text.strip()
+            cache_reply(user_message, reply)
+            return reply
 
         except Exception as e:
-            print(f"Gemini API Error (Attempt {attempt + 1}/{max_retries}): {e}")
+            print(f"Gemini API Error (Attempt {attempt + 1}/{max_retries}): {e!r}")
             
             # If not last attempt, retry with backoff
             if attempt < max_retries - 1:
-                time.sleep(retry_delay)
+                await asyncio.sleep(retry_delay)
                 retry_delay *= 2  # Exponential backoff
                 continue
             
             # Last attempt failed
-            return f"Sorry, main abhi kuch technical issue face kar raha hoon. Please {STORE_INFO['contact']} par contact karein. 🤖"
+            return TECHNICAL_ISSUE_REPLY
     
     return "Sorry, I am having trouble thinking right now. Please try again later."
+
+async def stream_chat_response(db: Session, user_message: str):
+    """
+    Streaming variant of get_chat_response: an async generator of reply text
+    chunks, forwarded as the model produces them (generate_content_async with
+    stream=True). A failed or empty attempt is retried only while nothing has
+    been sent yet; REQUEST_TIMEOUT applies to each chunk.
+    """
+    model = init_model()
+    if model is None:
+        yield MISSING_KEY_REPLY
+        return
+
+    cached = get_cached_reply(user_message)
+    if cached is not None:
+        yield cached
+        return
+
+    try:
+        system_prompt = await asyncio.to_thread(build_system_prompt, db, user_message)
+    except Exception as e:
+        print(f"Chat prompt error: {e}")
+        yield TECHNICAL_ISSUE_REPLY
+        return
+
+    max_retries = 3
+    retry_delay = 1  # seconds
+    
+    for attempt in range(max_retries):
+        parts = []
+        try:
+            async with _limiter:
+                response = await asyncio.wait_for(
+                    model.generate_content_async(system_prompt, stream=True), REQUEST_TIMEOUT
+                )
+                chunks = response.__aiter__()
+                while True:
+                    try:
+                        chunk = await asyncio.wait_for(chunks.__anext__(), REQUEST_TIMEOUT)
+                    except StopAsyncIteration:
+                        break
+                    if chunk.text:
+                        parts.append(chunk.text)
+                        yield chunk.text
+            if parts:
+                cache_reply(user_message, "".join(parts).strip())
+                return
+        except Exception as e:
+            print(f"Gemini API Error (Attempt {attempt + 1}/{max_retries}): {e!r}")
+            if parts:
+                # Part of the reply is already out; a retry would repeat it
+                yield "\n\n" + TECHNICAL_ISSUE_REPLY
+                return
+        
+        if attempt < max_retries - 1:
+            await asyncio.sleep(retry_delay)
+            retry_delay *= 2  # Exponential backoff
+    
+    yield TECHNICAL_ISSUE_REPLY
@@ -1,5 +1,10 @@
-from sqlalchemy.orm import Session
+from datetime import datetime
+from sqlalchemy import func, or_, case, insert, update
+from sqlalchemy.orm import Session, selectinload
 import models, schemas
+import forecast_models
+import response_cache
+import dashboard_metrics
 
 def get_product(db: Session, product_id: int):
     return db.query(models.Product).filter(models.Product.id == product_id).first()
@@ -7,37 +12,208 @@ def get_product(db: Session, product_id: int):
 def get_products(db: Session, skip: int = 0, limit: int = 100):
     return db.query(models.Product).offset(skip).limit(limit).all()
 
+# Bumped when product content changes: a product is added, edited or removed, or
+# goes in or out of stock. Plain stock decrements leave it alone, so caches
+# keyed on it (the chatbot's index and replies) survive checkouts.
+_content_version = 0
+
+def content_version() -> int:
+    return _content_version
+
+def catalog_changed(content: bool = True):
+    """
+    Products or stock changed: drop cached catalog responses, and bump the
+    content version unless only stock counts moved (content=False)
+    """
+    global _content_version
+    if content:
+        _content_version += 1
+    response_cache.catalog_cache.invalidate()
+
 def create_product(db: Session, product: schemas.ProductCreate):
     db_product = models.Product(**product.dict())
     db.add(db_product)
+    dashboard_metrics.apply(db, {dashboard_metrics.TOTAL_PRODUCTS: 1})
     db.commit()
     db.refresh(db_product)
+    catalog_changed()
     return db_product
 
+def update_product(db: Session, product_id: int, product: schemas.ProductCreate):
+    db_product = get_product(db, product_id)
+    if not db_product:
+        return None
+    
+    # Basic cleanup: remove trailing/leading spaces from name
+    if product.name:
+        product.name = product.name.strip()
+        
+    for key, value in product.dict().items():
+        setattr(db_product, key, value)
+    
+    db.commit()
+    db.refresh(db_product)
+    catalog_changed()
+    return db_product
+
+def delete_product(db: Session, product_id: int):
+    db_product = get_product(db, product_id)
+    if not db_product:
+        return False
+    
+    db.delete(db_product)
+    dashboard_metrics.apply(db, {dashboard_metrics.TOTAL_PRODUCTS: -1})
+    db.commit()
+    catalog_changed()
+    return True
+
 def get_user_by_email(db: Session, email: str):
     return db.query(models.User).filter(models.User.email == email).first()
 
 
+def _sales_day(value) -> datetime:
+    # Midnight of the day (accepts datetimes and SQL date() strings/dates)
+    return datetime.fromisoformat(str(value)[:10])
+
+def _update_sales_history(db: Session, order: models.Order, items, sign: int = 1):
+    """
+    Add (sign=1) or remove (sign=-1) order items in the daily SalesHistory
+    rollup with atomic increments. Cancelled orders are never counted.
+    Does not commit, so it shares the caller's transaction.
+    """
+    totals = {}
+    for item in items:
+        quantity, revenue = totals.get(item.product_id, (0, 0.0))
+        totals[item.product_id] = (quantity + item.quantity,
+                                   revenue + item.quantity * (item.price_at_purchase or 0))
+    _add_daily_sales(db, _sales_day(order.created_at), totals, sign)
+
+def _add_daily_sales(db: Session, day: datetime, totals: dict, sign: int = 1):
+    """
+    Apply {product_id: (quantity, revenue)} to the SalesHistory rows of day
+    """
+    if not totals:
+        return
+    
+    SalesHistory = forecast_models.SalesHistory
+    # One UPDATE for every product's row of the day, then insert the rows that did not exist yet
+    updated = db.query(SalesHistory).filter(
+        SalesHistory.product_id.in_(totals),
+        SalesHistory.date == day
+    ).update({
+        SalesHistory.quantity_sold: SalesHistory.quantity_sold + sign * case(
+            {pid: q for pid, (q, _) in totals.items()}, value=SalesHistory.product_id),
+        SalesHistory.revenue: SalesHistory.revenue + sign * case(
+            {pid: r for pid, (_, r) in totals.items()}, value=SalesHistory.product_id)
+    }, synchronize_session=False)
+    if updated < len(totals):
+        existing = {pid for pid, in db.query(SalesHistory.product_id).filter(
+            SalesHistory.product_id.in_(totals), SalesHistory.date == day)}
+        db.bulk_insert_mappings(SalesHistory, [{
+            'product_id': product_id, 'date': day,
+            'quantity_sold': sign * quantity, 'revenue': sign * revenue
+        } for product_id, (quantity, revenue) in totals.items() if product_id not in existing])
+    db.flush()
+
+def rebuild_sales_history(db: Session):
+    """
+    Recompute the whole SalesHistory rollup from orders (backfill / repair)
+    """
+    sale_day = func.date(models.Order.created_at)
+    rows = db.query(
+        models.OrderItem.product_id,
+        sale_day,
+        func.sum(models.OrderItem.quantity),
+        func.sum(models.OrderItem.quantity * models.OrderItem.price_at_purchase)
+    ).join(
+        models.Order
+    ).filter(
+        or_(models.Order.status.is_(None), models.Order.status != "cancelled")
+    ).group_by(
+        models.OrderItem.product_id, sale_day
+    ).all()
+    
+    db.query(forecast_models.SalesHistory).delete()
+    db.bulk_insert_mappings(forecast_models.SalesHistory, [
+        {"product_id": product_id, "date": _sales_day(day), "quantity_sold": quantity or 0, "revenue": revenue or 0.0}
+        for product_id, day, quantity, revenue in rows
+    ])
+    db.commit()
+
+def backfill_sales_history(db: Session):
+    """
+    Build the rollup once for databases that have orders but no SalesHistory yet
+    """
+    if db.query(forecast_models.SalesHistory.id).first() is None and db.query(models.OrderItem.id).first() is not None:
+        print("Backfilling daily sales history...")
+        rebuild_sales_history(db)
+
+def get_orders(db: Session, skip: int = 0, limit: int = 100, before_id: int = None, status: str = None,
+               customer_email: str = None, created_from: datetime = None, created_to: datetime = None):
+    """
+    Newest orders first, with their items loaded by one extra IN query (not one query per order).
+    before_id pages by key (orders with a smaller id) so deep pages stay an index range scan;
+    the filters use the Order indexes.
+    """
+    query = db.query(models.Order).options(selectinload(models.Order.items))
+    if before_id is not None:
+        query = query.filter(models.Order.id < before_id)
+    if status:
+        query = query.filter(models.Order.status == status)
+    if customer_email:
+        query = query.filter(models.Order.customer_email == customer_email)
+    if created_from:
+        query = query.filter(models.Order.created_at >= created_from)
+    if created_to:
+        query = query.filter(models.Order.created_at < created_to)
+    return query.order_by(models.Order.id.desc()).offset(skip).limit(limit).all()
+
 def update_order_status(db: Session, order_id: int, status: str):
     db_order = db.query(models.Order).filter(models.Order.id == order_id).first()
     if db_order:
+        # Cancelling removes the order from the sales rollup, un-cancelling restores it
+        was_cancelled = db_order.status == "cancelled"
+        if was_cancelled != (status == "cancelled"):
+            _update_sales_history(db, db_order, db_order.items, sign=1 if was_cancelled else -1)
         db_order.status = status
         db.commit()
         db.refresh(db_order)
     return db_order
 
 def create_order(db: Session, order: schemas.OrderCreate):
-    # 1. Deduct stock and validate availability
+    """
+    Create an order in one transaction: one IN fetch of the products, one
+    conditional UPDATE that decrements every product's stock only if enough
+    is left (safe with concurrent checkouts), then the order and its items
+    """
+    # 1. Quantities per product (a product may appear on several lines)
+    quantities = {}
     for item in order.items:
-        product = db.query(models.Product).filter(models.Product.id == item.product_id).first()
-        if not product:
-            raise Exception(f"Product {item.product_id} not found")
-        if product.stock_quantity < item.quantity:
-            raise Exception(f"Not enough stock for {product.name}")
-        
-        product.stock_quantity -= item.quantity
+        if item.quantity <= 0:
+            raise Exception(f"Invalid quantity for product {item.product_id}")
+        quantities[item.product_id] = quantities.get(item.product_id, 0) + item.quantity
+    if not quantities:
+        raise Exception("Order has no items")
     
-    # 2. Create Order
+    products = {
+        row.id: row for row in db.query(models.Product.id, models.Product.name, models.Product.price)
+        .filter(models.Product.id.in_(quantities))
+    }
+    for product_id in quantities:
+        if product_id not in products:
+            raise Exception(f"Product {product_id} not found")
+    
+    # 2. Deduct stock and validate availability in a single statement
+    left = _deduct_stock(db, quantities)
+    if len(left) != len(quantities):
+        db.rollback()
+        short = db.query(models.Product.name).filter(
+            models.Product.id.in_(quantities),
+            models.Product.stock_quantity < case(quantities, value=models.Product.id)
+        ).first()
+        raise Exception(f"Not enough stock for {short.name if short else 'an item in the order'}")
+    
+    # 3. Create Order and Order Items
     db_order = models.Order(
         customer_name=order.customer_name,
         customer_email=order.customer_email,
@@ -46,30 +222,180 @@ def create_order(db: Session, order: schemas.OrderCreate):
         status="pending"
     )
     db.add(db_order)
-    db.commit()
-    db.refresh(db_order)
-
-    # 3. Create Order Items
+    db.flush()
+    
+    totals = {}
+    item_rows = []
     for item in order.items:
-        product = db.query(models.Product).filter(models.Product.id == item.product_id).first()
-        db_item = models.OrderItem(
-            order_id=db_order.id,
-            product_id=item.product_id,
-            quantity=item.quantity,
-            price_at_purchase=product.price
-        )
-        db.add(db_item)
+        price = products[item.product_id].price
+        item_rows.append({
+            'order_id': db_order.id,
+            'product_id': item.product_id,
+            'quantity': item.quantity,
+            'price_at_purchase': price
+        })
+        quantity, revenue = totals.get(item.product_id, (0, 0.0))
+        totals[item.product_id] = (quantity + item.quantity, revenue + item.quantity * (price or 0))
+    db.execute(insert(models.OrderItem), item_rows)  # executemany
+    
+    # 4. Roll the sales into the daily history and the dashboard totals
+    _add_daily_sales(db, _sales_day(db_order.created_at), totals)
+    dashboard_metrics.apply(db, dashboard_metrics.order_deltas(db_order))
     
     db.commit()
-    db.refresh(db_order)
+    catalog_changed(content=any(stock <= 0 for stock in left))  # Stock quantities changed
     return db_order
 
+def _deduct_stock(db: Session, quantities: dict) -> list:
+    """
+    Subtract {product_id: quantity} from stock in one conditional UPDATE.
+    Returns the remaining stock of the rows that had enough; fewer rows than
+    quantities means some product was short and nothing should be kept.
+    """
+    ordered = case(quantities, value=models.Product.id)
+    return db.execute(
+        update(models.Product)
+        .where(models.Product.id.in_(quantities), models.Product.stock_quantity >= ordered)
+        .values(stock_quantity=models.Product.stock_quantity - ordered)
+        .returning(models.Product.stock_quantity)
+        .execution_options(synchronize_session=False)
+    ).scalars().all()
+
+BULK_ORDER_CHUNK = 500
+
+def create_orders_bulk(db: Session, orders):
+    """
+    Create many orders, one transaction per BULK_ORDER_CHUNK orders.
+    orders is a list of (index, schemas.OrderCreate); index is echoed back.
+    Stock is validated per chunk in aggregate, allocated to orders in input
+    order; an order that cannot be filled fails on its own without aborting
+    the rest. Returns (created [(index, order_id)], failed [{index, error}]).
+    """
+    created, failed, sold_out = [], [], False
+    for start in range(0, len(orders), BULK_ORDER_CHUNK):
+        chunk = orders[start:start + BULK_ORDER_CHUNK]
+        for attempt in range(3):
+            result = _create_orders_chunk(db, chunk)
+            if result is not None:
+                break
+            db.rollback()  # Stock was taken by a concurrent writer; allocate again
+        else:
+            result = [], [{"index": index, "error": "Stock changed during import, please retry"}
+                          for index, _ in chunk], False
+        created.extend(result[0])
+        failed.extend(result[1])
+        sold_out = sold_out or result[2]
+    if created:
+        catalog_changed(content=sold_out)
+    return created, failed
+
+def _create_orders_chunk(db: Session, chunk):
+    """
+    One transaction of create_orders_bulk as (created, failed, whether a product
+    sold out), or None when the conditional stock update lost a race (the
+    caller rolls back and retries)
+    """
+    product_ids = {item.product_id for _, order in chunk for item in order.items}
+    products = {}
+    ids = list(product_ids)
+    for i in range(0, len(ids), BULK_ORDER_CHUNK):
+        products.update({row.id: row for row in db.query(
+            models.Product.id, models.Product.name, models.Product.price, models.Product.stock_quantity
+        ).filter(models.Product.id.in_(ids[i:i + BULK_ORDER_CHUNK]))})
+    
+    # 1. Allocate stock to orders in input order
+    remaining = {pid: p.stock_quantity for pid, p in products.items()}
+    accepted, failed = [], []
+    for index, order in chunk:
+        quantities = {}
+        for item in order.items:
+            quantities[item.product_id] = quantities.get(item.product_id, 0) + item.quantity
+        error = None
+        if not quantities:
+            error = "Order has no items"
+        for product_id, quantity in quantities.items():
+            if error:
+                break
+            if product_id not in products:
+                error = f"Product {product_id} not found"
+            elif quantity <= 0:
+                error = f"Invalid quantity for product {product_id}"
+            elif remaining[product_id] < quantity:
+                error = f"Not enough stock for {products[product_id].name}"
+        if error:
+            failed.append({"index": index, "error": error})
+            continue
+        for product_id, quantity in quantities.items():
+            remaining[product_id] -= quantity
+        accepted.append((index, order))
+    
+    if not accepted:
+        return [], failed, False
+    
+    # 2. Deduct the aggregate quantities; every row must still have enough stock
+    used = {pid: products[pid].stock_quantity - left for pid, left in remaining.items()
+            if left != products[pid].stock_quantity}
+    used_ids = list(used)
+    sold_out = False
+    for i in range(0, len(used_ids), BULK_ORDER_CHUNK):
+        part = {pid: used[pid] for pid in used_ids[i:i + BULK_ORDER_CHUNK]}
+        left = _deduct_stock(db, part)
+        if len(left) != len(part):
+            return None
+        sold_out = sold_out or any(stock <= 0 for stock in left)
+    
+    # 3. Orders and items with executemany
+    now = datetime.utcnow()
+    order_ids = db.execute(
+        insert(models.Order).returning(models.Order.id, sort_by_parameter_order=True),
+        [{
+            'customer_name': order.customer_name,
+            'customer_email': order.customer_email,
+            'shipping_address': order.shipping_address,
+            'total_amount': order.total_amount,
+            'status': "pending",
+            'created_at': now
+        } for _, order in accepted]
+    ).scalars().all()
+    
+    totals = {}
+    item_rows = []
+    for order_id, (_, order) in zip(order_ids, accepted):
+        for item in order.items:
+            price = products[item.product_id].price
+            item_rows.append({
+                'order_id': order_id,
+                'product_id': item.product_id,
+                'quantity': item.quantity,
+                'price_at_purchase': price
+            })
+            quantity, revenue = totals.get(item.product_id, (0, 0.0))
+            totals[item.product_id] = (quantity + item.quantity, revenue + item.quantity * (price or 0))
+    db.execute(insert(models.OrderItem), item_rows)
+    
+    # 4. Roll the sales into the daily history and the dashboard totals
+    _add_daily_sales(db, _sales_day(now), totals)
+    amount = sum(order.total_amount or 0 for _, order in accepted)
+    dashboard_metrics.apply(db, {
+        dashboard_metrics.TOTAL_ORDERS: len(accepted),
+        dashboard_metrics.TOTAL_SALES: amount,
+        dashboard_metrics.monthly_sales_key(now): amount
+    })
+    
+    db.commit()
+    return [(index, order_id) for (index, _), order_id in zip(accepted, order_ids)], failed, sold_out
+
 def delete_order(db: Session, order_id: int):
     # Retrieve order
     db_order = db.query(models.Order).filter(models.Order.id == order_id).first()
     if not db_order:
         return False
     
+    # Take the order out of the daily sales rollup and the dashboard totals
+    if db_order.status != "cancelled":
+        _update_sales_history(db, db_order, db_order.items, sign=-1)
+    dashboard_metrics.apply(db, dashboard_metrics.order_deltas(db_order, sign=-1))
+    
     # Delete associated order items first (if cascade is not set in models, but safe to do explicit)
     db.query(models.OrderItem).filter(models.OrderItem.order_id == order_id).delete()
     
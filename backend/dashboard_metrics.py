@@ -0,0 +1,102 @@
+"""
+Running totals behind GET /admin/stats, kept in the DashboardMetric table.
+The CRUD paths apply deltas in their own transactions; reconcile() recomputes
+everything from orders/products to repair drift (e.g. writes made by scripts).
+"""
+import os
+import threading
+from collections import defaultdict
+from datetime import datetime
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+import models
+
+TOTAL_SALES = "total_sales"
+TOTAL_ORDERS = "total_orders"
+TOTAL_PRODUCTS = "total_products"
+RECONCILE_INTERVAL = float(os.getenv("METRICS_RECONCILE_INTERVAL", "3600"))  # seconds
+
+
+def monthly_sales_key(moment: datetime) -> str:
+    return f"monthly_sales:{moment:%Y-%m}"
+
+
+def order_deltas(order: models.Order, sign: int = 1) -> dict:
+    """Metric changes for adding (sign=1) or removing (sign=-1) an order"""
+    amount = sign * (order.total_amount or 0)
+    return {TOTAL_ORDERS: sign, TOTAL_SALES: amount, monthly_sales_key(order.created_at): amount}
+
+
+def apply(db: Session, deltas: dict):
+    """
+    Add {name: delta} to the metrics with atomic increments.
+    Does not commit, so it shares the caller's transaction.
+    """
+    Metric = models.DashboardMetric
+    for name, delta in deltas.items():
+        if not delta:
+            continue
+        updated = db.query(Metric).filter(Metric.name == name).update(
+            {Metric.value: Metric.value + delta}, synchronize_session=False
+        )
+        if not updated:
+            db.add(Metric(name=name, value=delta))
+    db.flush()
+
+
+def read(db: Session, now: datetime = None) -> dict:
+    """Current dashboard totals in one indexed lookup"""
+    now = now or datetime.utcnow()
+    names = [TOTAL_SALES, TOTAL_ORDERS, TOTAL_PRODUCTS, monthly_sales_key(now)]
+    values = dict(db.query(models.DashboardMetric.name, models.DashboardMetric.value)
+                  .filter(models.DashboardMetric.name.in_(names)))
+    return {
+        "total_sales": values.get(TOTAL_SALES, 0),
+        "monthly_sales": values.get(monthly_sales_key(now), 0),
+        "total_orders": int(values.get(TOTAL_ORDERS, 0)),
+        "total_products": int(values.get(TOTAL_PRODUCTS, 0))
+    }
+
+
+def reconcile(db: Session):
+    """
+    Recompute every metric from orders and products. The delete runs first so
+    the write lock is held while aggregating and no concurrent order is missed.
+    """
+    db.query(models.DashboardMetric).delete(synchronize_session=False)
+
+    total_orders, total_sales = db.query(func.count(models.Order.id), func.sum(models.Order.total_amount)).one()
+    rows = [{"name": TOTAL_ORDERS, "value": total_orders},
+            {"name": TOTAL_SALES, "value": total_sales or 0},
+            {"name": TOTAL_PRODUCTS, "value": db.query(func.count(models.Product.id)).scalar()}]
+
+    # Months are bucketed here rather than in SQL to stay portable across backends
+    monthly = defaultdict(float)
+    for created_at, amount in (db.query(models.Order.created_at, models.Order.total_amount)
+                               .filter(models.Order.created_at.isnot(None))):
+        monthly[monthly_sales_key(created_at)] += amount or 0
+    rows += [{"name": name, "value": value} for name, value in monthly.items()]
+    db.bulk_insert_mappings(models.DashboardMetric, rows)
+    db.commit()
+
+
+def backfill(db: Session):
+    """Build the metrics once for databases that predate them"""
+    if db.query(models.DashboardMetric.id).first() is None:
+        print("Building dashboard metrics...")
+        reconcile(db)
+
+
+def start_reconciler(session_factory, interval: float = RECONCILE_INTERVAL):
+    """Reconcile every interval seconds on a daemon thread"""
+    def loop():
+        while not stop.wait(interval):
+            try:
+                with session_factory() as db:
+                    reconcile(db)
+            except Exception as e:
+                print(f"Dashboard metrics reconcile failed: {e}")
+
+    stop = threading.Event()
+    threading.Thread(target=loop, name="metrics-reconcile", daemon=True).start()
+    return stop
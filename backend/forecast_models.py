@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey
+from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Index
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from database import Base
@@ -18,6 +18,23 @@ class DemandForecast(Base):
     
     # Relationship
     product = relationship("Product")
+    
+    __table_args__ = (Index("ix_demand_forecasts_product_date", "product_id", "forecast_date"),)
+
+
+class ForecastSeries(Base):
+    """Columnar copy of a product's forecast: one row per product, daily values as arrays"""
+    __tablename__ = "forecast_series"
+
+    id = Column(Integer, primary_key=True, index=True)
+    product_id = Column(Integer, ForeignKey("products.id"), unique=True, index=True)
+    start_date = Column(DateTime)  # Date of the first prediction; day i is start_date + i days
+    horizon = Column(Integer)  # Number of daily predictions
+    predicted_demand = Column(String)  # JSON array of floats
+    confidence_lower = Column(String)  # JSON array of floats
+    confidence_upper = Column(String)  # JSON array of floats
+    model_used = Column(String)
+    created_at = Column(DateTime, default=datetime.utcnow)
 
 
 class StockAlert(Base):
@@ -38,8 +55,9 @@ class StockAlert(Base):
 
 
 class SalesHistory(Base):
-    """Aggregated daily sales data for ML training"""
+    """Aggregated daily sales data for ML training (kept up to date by crud)"""
     __tablename__ = "sales_history"
+    __table_args__ = (Index("ix_sales_history_product_date", "product_id", "date"),)
 
     id = Column(Integer, primary_key=True, index=True)
     product_id = Column(Integer, ForeignKey("products.id"))
@@ -49,3 +67,32 @@ class SalesHistory(Base):
     
     # Relationship
     product = relationship("Product")
+
+
+class ForecastHyperparameters(Base):
+    """Cached Random Forest hyperparameters from the last grid search"""
+    __tablename__ = "forecast_hyperparameters"
+
+    id = Column(Integer, primary_key=True, index=True)
+    cache_key = Column(String, unique=True, index=True)  # 'product:<id>' or 'category:<name>'
+    params = Column(String)  # JSON encoded best_params_
+    rmse = Column(Float)  # Random Forest test RMSE when the search ran
+    searched_at = Column(DateTime, default=datetime.utcnow, nullable=True)  # NULL = search again
+
+
+class TrainedModel(Base):
+    """Registry entry for a fitted model saved on disk by model_registry"""
+    __tablename__ = "trained_models"
+
+    id = Column(Integer, primary_key=True, index=True)
+    product_id = Column(Integer, ForeignKey("products.id"), nullable=True, index=True)  # NULL = global model
+    model_name = Column(String)  # e.g. 'random_forest', 'global_linear_regression'
+    artifact_path = Column(String)  # joblib file
+    features = Column(String)  # JSON list of feature columns, in model order
+    train_start = Column(DateTime)  # First day of the training window
+    train_end = Column(DateTime)  # Last day of the training window
+    metrics = Column(String)  # JSON encoded training metrics
+    settings = Column(String)  # JSON, e.g. category codes of the global model
+    last_order_item_id = Column(Integer, nullable=True)  # Watermark: newest order item seen when trained
+    units_sold = Column(Integer, nullable=True)  # Watermark: all-time units in the sales rollup when trained
+    trained_at = Column(DateTime, default=datetime.utcnow)
@@ -1,6 +1,10 @@
 """
 Demand Forecasting Engine using Linear Regression and Random Forest
 """
+import os
+import json
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
 import pandas as pd
 import numpy as np
 from datetime import datetime, timedelta
@@ -8,9 +12,276 @@ from sklearn.linear_model import LinearRegression
 from sklearn.ensemble import RandomForestRegressor
 from sklearn.metrics import mean_squared_error, mean_absolute_error, r2_score
 from sklearn.model_selection import train_test_split, GridSearchCV, TimeSeriesSplit
+from sqlalchemy import func, and_, select
 from sqlalchemy.orm import Session
 import models
 import forecast_models
+import model_registry
+
+LAGS = (7, 14, 30)
+ROLLING_WINDOWS = (3, 5, 7, 30, 60)
+
+FEATURE_COLS = ['day_of_week', 'month', 'is_weekend', 'day_of_month',
+                'sales_lag_7', 'sales_lag_14', 'sales_lag_30',
+                'rolling_mean_3', 'rolling_mean_5',
+                'rolling_mean_7', 'rolling_mean_30', 'rolling_mean_60', 'rolling_std_7', 'trend']
+FEATURE_INDEX = {col: i for i, col in enumerate(FEATURE_COLS)}
+CALENDAR_COLS = ['day_of_week', 'month', 'is_weekend', 'day_of_month']
+ROLLING_COLS = [f'rolling_mean_{w}' for w in ROLLING_WINDOWS] + ['rolling_std_7']
+
+# Random Forest settings used without a cached or fresh grid search
+DEFAULT_RF_PARAMS = {'n_estimators': 100, 'max_depth': 10, 'min_samples_split': 5}
+
+# Global model: one pooled model for all products. Each product's own sales level
+# (rolling_mean_60) tells products apart, plus a one-hot category. Raw ids or
+# ordinal codes would let the linear model fit a slope across arbitrary numbers.
+def global_feature_cols(categories) -> list:
+    """Feature columns of a global model trained over these categories"""
+    return FEATURE_COLS + [f'category_{category}' for category in categories]
+
+
+class SalesMatrix:
+    """Dense product x day sales matrix shared by every per-product forecast"""
+
+    def __init__(self, product_ids, dates: pd.DatetimeIndex, values: np.ndarray):
+        self.product_ids = np.asarray(product_ids, dtype=np.int64)
+        self.dates = dates
+        self.values = values
+        self.index = {int(pid): row for row, pid in enumerate(self.product_ids)}
+
+
+def load_sales_matrix(db: Session, days: int = 60, product_ids=None) -> SalesMatrix:
+    """
+    Load daily sales of all products with a single query over the SalesHistory rollup
+    """
+    cutoff_date = datetime.utcnow() - timedelta(days=days)
+    date_range = pd.date_range(start=cutoff_date.date(), end=datetime.utcnow().date(), freq='D')
+
+    if product_ids is None:
+        product_ids = [pid for (pid,) in db.query(models.Product.id).order_by(models.Product.id)]
+
+    SalesHistory = forecast_models.SalesHistory
+    rows = db.query(
+        SalesHistory.product_id,
+        SalesHistory.date,
+        func.sum(SalesHistory.quantity_sold)
+    ).filter(
+        SalesHistory.date >= date_range[0].to_pydatetime()
+    ).group_by(
+        SalesHistory.product_id, SalesHistory.date
+    ).all()
+
+    matrix = SalesMatrix(product_ids, date_range, np.zeros((len(product_ids), len(date_range))))
+    start = date_range[0]
+    for product_id, day, quantity in rows:
+        row = matrix.index.get(product_id)
+        col = (pd.Timestamp(day) - start).days
+        if row is not None and 0 <= col < len(date_range):
+            matrix.values[row, col] = quantity or 0
+
+    return matrix
+
+
+def engineer_panel_features(values: np.ndarray, dates: pd.DatetimeIndex) -> np.ndarray:
+    """
+    Vectorized engineer_features for a whole product x day sales matrix:
+    every lag and rolling statistic of every product in one NumPy pass
+    (rolling sums from cumulative sums). Returns a C-contiguous float32
+    (products, days, len(FEATURE_COLS)) tensor.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    n_products, n_days = values.shape
+    features = np.zeros((n_products, n_days, len(FEATURE_COLS)), dtype=np.float32)
+    
+    # Time-based features (the same for every product)
+    day_of_week = dates.dayofweek.to_numpy()
+    features[:, :, FEATURE_INDEX['day_of_week']] = day_of_week
+    features[:, :, FEATURE_INDEX['month']] = dates.month.to_numpy()
+    features[:, :, FEATURE_INDEX['is_weekend']] = day_of_week >= 5
+    features[:, :, FEATURE_INDEX['day_of_month']] = dates.day.to_numpy()
+    features[:, :, FEATURE_INDEX['trend']] = np.arange(n_days)
+    
+    # Lags (missing history is 0)
+    for lag in LAGS:
+        if lag < n_days:
+            features[:, lag:, FEATURE_INDEX[f'sales_lag_{lag}']] = values[:, :-lag]
+    
+    # Rolling windows ending at each day, truncated at the start (min_periods=1)
+    cumsum = np.zeros((n_products, n_days + 1))
+    np.cumsum(values, axis=1, out=cumsum[:, 1:])
+    cumsum_sq = np.zeros((n_products, n_days + 1))
+    np.cumsum(values ** 2, axis=1, out=cumsum_sq[:, 1:])
+    end = np.arange(1, n_days + 1)
+    for w in ROLLING_WINDOWS:
+        start = np.maximum(end - w, 0)
+        count = end - start
+        sums = cumsum[:, end] - cumsum[:, start]
+        features[:, :, FEATURE_INDEX[f'rolling_mean_{w}']] = sums / count
+        if w == 7:
+            # Sample std (ddof=1); a single observation has none, like fillna(0)
+            variance = (cumsum_sq[:, end] - cumsum_sq[:, start] - sums ** 2 / count) / np.maximum(count - 1, 1)
+            features[:, :, FEATURE_INDEX['rolling_std_7']] = np.where(count > 1, np.sqrt(np.maximum(variance, 0)), 0)
+    
+    return features
+
+
+def _panel_frame(features: np.ndarray, dates: pd.DatetimeIndex, sales: np.ndarray) -> pd.DataFrame:
+    """
+    One product's slice of the panel tensor as an engineer_features style frame
+    """
+    df = pd.DataFrame(features, columns=FEATURE_COLS)
+    df.insert(0, 'date', dates)
+    df.insert(1, 'sales', sales)
+    return df
+
+
+def _series_mapping(product_id: int, model_used: str, predictions: list) -> dict:
+    """
+    ForecastSeries values for one product's date-ordered prediction records
+    """
+    def column(key):
+        return json.dumps([round(float(p[key]), 3) for p in predictions], separators=(',', ':'))
+    
+    return {
+        'product_id': product_id,
+        'start_date': predictions[0]['date'] if predictions else None,
+        'horizon': len(predictions),
+        'predicted_demand': column('predicted_demand'),
+        'confidence_lower': column('confidence_lower'),
+        'confidence_upper': column('confidence_upper'),
+        'model_used': model_used
+    }
+
+
+def backfill_forecast_series(db):
+    """
+    Build the columnar forecast copy once for databases that have forecasts but no ForecastSeries yet
+    """
+    if db.query(forecast_models.ForecastSeries.id).first() is not None:
+        return
+    if db.query(forecast_models.DemandForecast.id).first() is None:
+        return
+    
+    print("Backfilling columnar forecasts...")
+    rows = db.query(
+        forecast_models.DemandForecast.product_id,
+        forecast_models.DemandForecast.model_used,
+        forecast_models.DemandForecast.forecast_date,
+        forecast_models.DemandForecast.predicted_demand,
+        forecast_models.DemandForecast.confidence_lower,
+        forecast_models.DemandForecast.confidence_upper
+    ).order_by(forecast_models.DemandForecast.product_id, forecast_models.DemandForecast.forecast_date)
+    
+    mappings, current, model_used, predictions = [], None, None, []
+    for product_id, model, date, demand, lower, upper in rows.yield_per(5000):
+        if product_id != current:
+            if predictions:
+                mappings.append(_series_mapping(current, model_used, predictions))
+            current, model_used, predictions = product_id, model, []
+        predictions.append({'date': date, 'predicted_demand': demand,
+                            'confidence_lower': lower, 'confidence_upper': upper})
+    if predictions:
+        mappings.append(_series_mapping(current, model_used, predictions))
+    
+    db.bulk_insert_mappings(forecast_models.ForecastSeries, mappings)
+    db.commit()
+
+
+ALERT_LEVELS = ("critical", "warning", "info")
+
+
+def prediction_filters(category: str = None, alert_level: str = None, product_ids=None):
+    """
+    SQL criteria on Product for the predictions listing: category, active
+    stock alert level and explicit product ids
+    """
+    criteria = []
+    if category:
+        criteria.append(models.Product.category == category)
+    if alert_level:
+        criteria.append(models.Product.id.in_(
+            select(forecast_models.StockAlert.product_id).where(
+                forecast_models.StockAlert.status == "active",
+                forecast_models.StockAlert.alert_type == alert_level
+            )
+        ))
+    if product_ids:
+        criteria.append(models.Product.id.in_(list(product_ids)))
+    return criteria
+
+
+def iter_prediction_records(db, columnar: bool = False, criteria=(), start_date=None, end_date=None):
+    """
+    Yield one predictions record per product matching criteria (products
+    without forecasts get empty predictions) while streaming tuples from the
+    database, never holding every forecast row or ORM object in memory.
+    start_date/end_date (inclusive dates) limit the forecast days returned.
+    
+    Row format: {product_id, product_name, current_stock, predictions: [{date, ...}]}
+    Columnar format: {product_id, product_name, current_stock, start_date,
+    horizon, model_used, predicted_demand: [...], confidence_lower: [...],
+    confidence_upper: [...]} where day i is start_date + i days
+    """
+    window_start = datetime.combine(start_date, datetime.min.time()) if start_date else None
+    window_end = datetime.combine(end_date + timedelta(days=1), datetime.min.time()) if end_date else None
+    
+    Product = models.Product
+    if columnar:
+        Series = forecast_models.ForecastSeries
+        rows = db.query(
+            Product.id, Product.name, Product.stock_quantity, Series.start_date, Series.horizon,
+            Series.model_used, Series.predicted_demand, Series.confidence_lower, Series.confidence_upper
+        ).outerjoin(Series, Series.product_id == Product.id).filter(*criteria).order_by(Product.id)
+        
+        for pid, name, stock, start, horizon, model_used, demand, lower, upper in rows.yield_per(1000):
+            # The arrays are stored whole, so the date window is applied by slicing
+            first, last = 0, horizon or 0
+            if start is not None and window_start is not None:
+                first = max(first, -((start - window_start).days))
+            if start is not None and window_end is not None:
+                last = min(last, -((start - window_end).days))
+            first = min(first, max(last, 0))
+            window = slice(first, max(last, first))
+            yield {
+                "product_id": pid,
+                "product_name": name,
+                "current_stock": stock,
+                "start_date": (start + timedelta(days=first)).isoformat() if start else None,
+                "horizon": max(last - first, 0),
+                "model_used": model_used,
+                "predicted_demand": json.loads(demand)[window] if demand else [],
+                "confidence_lower": json.loads(lower)[window] if lower else [],
+                "confidence_upper": json.loads(upper)[window] if upper else []
+            }
+        return
+    
+    Forecast = forecast_models.DemandForecast
+    join_on = [Forecast.product_id == Product.id]
+    if window_start is not None:
+        join_on.append(Forecast.forecast_date >= window_start)
+    if window_end is not None:
+        join_on.append(Forecast.forecast_date < window_end)
+    rows = db.query(
+        Product.id, Product.name, Product.stock_quantity, Forecast.forecast_date, Forecast.predicted_demand,
+        Forecast.confidence_lower, Forecast.confidence_upper, Forecast.model_used
+    ).outerjoin(Forecast, and_(*join_on)).filter(*criteria).order_by(Product.id, Forecast.forecast_date)
+    
+    record = None
+    for pid, name, stock, date, demand, lower, upper, model_used in rows.yield_per(5000):
+        if record is None or record["product_id"] != pid:
+            if record is not None:
+                yield record
+            record = {"product_id": pid, "product_name": name, "current_stock": stock, "predictions": []}
+        if date is not None:
+            record["predictions"].append({
+                "date": date.isoformat(),
+                "predicted_demand": demand,
+                "confidence_lower": lower,
+                "confidence_upper": upper,
+                "model_used": model_used
+            })
+    if record is not None:
+        yield record
 
 
 class DemandForecaster:
@@ -27,26 +298,20 @@ class DemandForecaster:
         """
         Extract and prepare sales history for a product
         """
-        # Get orders from last 'days' days
+        # Get sales from last 'days' days
         cutoff_date = datetime.utcnow() - timedelta(days=days)
         
-        # Query order items for this product
-        order_items = self.db.query(
-            models.OrderItem
-        ).join(
-            models.Order
+        # Read the pre-aggregated daily rollup for this product
+        rows = self.db.query(
+            forecast_models.SalesHistory.date,
+            func.sum(forecast_models.SalesHistory.quantity_sold)
         ).filter(
-            models.OrderItem.product_id == product_id,
-            models.Order.created_at >= cutoff_date
+            forecast_models.SalesHistory.product_id == product_id,
+            forecast_models.SalesHistory.date >= datetime.combine(cutoff_date.date(), datetime.min.time())
+        ).group_by(
+            forecast_models.SalesHistory.date
         ).all()
-        
-        # Aggregate by date
-        sales_by_date = {}
-        for item in order_items:
-            date = item.order.created_at.date()
-            if date not in sales_by_date:
-                sales_by_date[date] = 0
-            sales_by_date[date] += item.quantity
+        sales_by_date = {date.date(): quantity or 0 for date, quantity in rows}
         
         # Create date range and fill missing dates with 0
         start_date = cutoff_date.date()
@@ -88,10 +353,17 @@ class DemandForecaster:
         
         return df
     
-    def train_models(self, df: pd.DataFrame):
+    def train_models(self, df: pd.DataFrame, rf_params: dict = None):
         """
         Train both Linear Regression and Random Forest models
+
+        The Random Forest is grid searched unless rf_params (e.g. from the
+        hyperparameter cache) is given, in which case it is fitted once.
         """
+        # Fresh estimators, so models returned for earlier products are never refit
+        self.lr_model = LinearRegression()
+        self.rf_model = RandomForestRegressor(n_estimators=100, max_depth=10, random_state=42)
+        
         # Fill NaNs with 0 instead of dropping to allow training on limited history
         df = df.fillna(0)
         
@@ -99,14 +371,9 @@ class DemandForecaster:
             print("⚠️ Warning: Very limited data history for training (< 7 days)")
             # Try to proceed but results might be flat
             
-        # Features and target
-        feature_cols = ['day_of_week', 'month', 'is_weekend', 'day_of_month',
-                       'sales_lag_7', 'sales_lag_14', 'sales_lag_30',
-                       'rolling_mean_3', 'rolling_mean_5',
-                       'rolling_mean_7', 'rolling_mean_30', 'rolling_mean_60', 'rolling_std_7', 'trend']
-        
-        X = df[feature_cols]
-        y = df['sales']
+        # Features and target (plain arrays so predict_future can feed NumPy rows)
+        X = df[FEATURE_COLS].to_numpy(dtype=float)
+        y = df['sales'].to_numpy(dtype=float)
         
         # Split data
         X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, shuffle=False)
@@ -118,21 +385,27 @@ class DemandForecaster:
         lr_mae = mean_absolute_error(y_test, lr_pred)
         lr_r2 = r2_score(y_test, lr_pred)
         
-        # Optimize Random Forest with Grid Search
-        print(">> Tuning Random Forest Hyperparameters...")
-        param_grid = {
-            'n_estimators': [50, 100],
-            'max_depth': [10, None],
-            'min_samples_split': [5]
-        }
-        
-        tscv = TimeSeriesSplit(n_splits=3)
-        grid_search = GridSearchCV(estimator=self.rf_model, param_grid=param_grid, 
-                                   cv=tscv, scoring='neg_mean_squared_error', n_jobs=1) # n_jobs=1 to avoid concurrency issues
-        grid_search.fit(X_train, y_train)
-        
-        self.rf_model = grid_search.best_estimator_
-        print(f">> Best RF Params: {grid_search.best_params_}")
+        rf_searched = rf_params is None
+        if rf_searched:
+            # Optimize Random Forest with Grid Search
+            print(">> Tuning Random Forest Hyperparameters...")
+            param_grid = {
+                'n_estimators': [50, 100],
+                'max_depth': [10, None],
+                'min_samples_split': [5]
+            }
+            
+            tscv = TimeSeriesSplit(n_splits=3)
+            grid_search = GridSearchCV(estimator=self.rf_model, param_grid=param_grid, 
+                                       cv=tscv, scoring='neg_mean_squared_error', n_jobs=1) # n_jobs=1 to avoid concurrency issues
+            grid_search.fit(X_train, y_train)
+            
+            self.rf_model = grid_search.best_estimator_
+            rf_params = grid_search.best_params_
+            print(f">> Best RF Params: {rf_params}")
+        else:
+            self.rf_model.set_params(**rf_params)
+            self.rf_model.fit(X_train, y_train)
         
         rf_pred = self.rf_model.predict(X_test)
         rf_rmse = np.sqrt(mean_squared_error(y_test, rf_pred))
@@ -149,6 +422,57 @@ class DemandForecaster:
             self.best_model_name = "random_forest"
             print(f">> Random Forest selected (RMSE: {rf_rmse:.2f}, MAE: {rf_mae:.2f}, R2: {rf_r2:.2f})")
         
+        return {
+            'lr_rmse': lr_rmse, 'lr_mae': lr_mae, 'lr_r2': lr_r2,
+            'rf_rmse': rf_rmse, 'rf_mae': rf_mae, 'rf_r2': rf_r2,
+            'rf_params': rf_params, 'rf_searched': rf_searched,
+            'best_model': self.best_model_name
+        }
+    
+    def train_global_model(self, features: np.ndarray, sales: np.ndarray, static_features: np.ndarray):
+        """
+        Train one Linear Regression and one Random Forest on the stacked
+        panel of all products (engineer_panel_features tensor plus one row of
+        one-hot category columns per product) and keep the better one as the
+        shared best_model
+        """
+        self.lr_model = LinearRegression()
+        self.rf_model = RandomForestRegressor(n_estimators=100, max_depth=10, min_samples_split=5,
+                                              random_state=42, n_jobs=-1)
+        
+        n_products, n_days, _ = features.shape
+        static = np.asarray(static_features, dtype=np.float32)
+        static = np.broadcast_to(static[:, None, :], (n_products, n_days, static.shape[1]))
+        X = np.concatenate([features, static], axis=2)
+        y = np.asarray(sales, dtype=float)
+        
+        # Split by date (last 20% of days for testing), not by row
+        split = int(n_days * 0.8)
+        X_train, X_test = X[:, :split].reshape(-1, X.shape[2]), X[:, split:].reshape(-1, X.shape[2])
+        y_train, y_test = y[:, :split].ravel(), y[:, split:].ravel()
+        
+        print(f">> Training global model on {n_products} products ({n_products * n_days} rows)...")
+        self.lr_model.fit(X_train, y_train)
+        lr_pred = self.lr_model.predict(X_test)
+        lr_rmse = np.sqrt(mean_squared_error(y_test, lr_pred))
+        lr_mae = mean_absolute_error(y_test, lr_pred)
+        lr_r2 = r2_score(y_test, lr_pred)
+        
+        self.rf_model.fit(X_train, y_train)
+        rf_pred = self.rf_model.predict(X_test)
+        rf_rmse = np.sqrt(mean_squared_error(y_test, rf_pred))
+        rf_mae = mean_absolute_error(y_test, rf_pred)
+        rf_r2 = r2_score(y_test, rf_pred)
+        
+        if lr_rmse <= rf_rmse:
+            self.best_model = self.lr_model
+            self.best_model_name = "global_linear_regression"
+            print(f">> Global Linear Regression selected (RMSE: {lr_rmse:.2f}, MAE: {lr_mae:.2f}, R2: {lr_r2:.2f})")
+        else:
+            self.best_model = self.rf_model
+            self.best_model_name = "global_random_forest"
+            print(f">> Global Random Forest selected (RMSE: {rf_rmse:.2f}, MAE: {rf_mae:.2f}, R2: {rf_r2:.2f})")
+        
         return {
             'lr_rmse': lr_rmse, 'lr_mae': lr_mae, 'lr_r2': lr_r2,
             'rf_rmse': rf_rmse, 'rf_mae': rf_mae, 'rf_r2': rf_r2,
@@ -159,168 +483,203 @@ class DemandForecaster:
         """
         Generate future predictions
         """
-        predictions = []
-        last_date = df['date'].max()
-        
-        feature_cols = ['day_of_week', 'month', 'is_weekend', 'day_of_month',
-                       'sales_lag_7', 'sales_lag_14', 'sales_lag_30',
-                       'rolling_mean_3', 'rolling_mean_5',
-                       'rolling_mean_7', 'rolling_mean_30', 'rolling_mean_60', 'rolling_std_7', 'trend']
+        predictions = self.predict_future_batch({0: df}, self.best_model, days_ahead)
+        return predictions.drop(columns='product_id')
+    
+    def predict_future_batch(self, frames: dict, models=None, days_ahead: int = 30,
+                             static_features: dict = None) -> pd.DataFrame:
+        """
+        Generate future predictions for many products at once, returned as
+        one long frame with a product_id column
 
-        # Use last row as base for predictions
-        last_row = df.iloc[-1].copy()
+        frames maps product_id -> engineered history; models is either a dict
+        product_id -> fitted model or one shared model (defaults to best_model).
+        static_features (product_id -> one-hot category) is required for
+        models trained by train_global_model.
+        Features live in a preallocated (products, days, features) tensor:
+        calendar, trend and rolling columns are filled for the whole horizon at
+        once, lag columns are read from a sales buffer that predictions are
+        written into. Since the shortest lag is 7 days, each 7-day block costs
+        one predict call per distinct model, whatever the number of products.
+        """
+        product_ids = list(frames)
+        if not product_ids:
+            return pd.DataFrame(columns=['product_id', 'date', 'predicted_demand',
+                                         'confidence_lower', 'confidence_upper'])
+        if models is None:
+            models = self.best_model
+        if not isinstance(models, dict):
+            models = {pid: models for pid in product_ids}
         
-        for i in range(1, days_ahead + 1):
-            future_date = last_date + timedelta(days=i)
-            
-            # Create features for future date
-            # Logic to fetch lags from 'predictions' list if we are far enough in future, else from history
-            
-            def get_lag_val(lag_days):
-                if i <= lag_days:
-                    # Look back in history
-                    # We need the value from (last_date + i - lag_days)
-                    # We can pick from df if it's there, or it's last_row's lags?
-                    # Simplified: Use df tail logic or last_row shifting
-                    # Ideally we maintain a 'rolling history' list
-                    return last_row['sales'] if lag_days == 1 else last_row[f'sales_lag_{lag_days-1}'] # Approximation for simplicity
-                else:
-                    return predictions[i - lag_days - 1]['predicted_demand']
-
-            # More robust lag retrieval
-            # We construct a synthetic history array: [past_sales..., pred_1, pred_2, ...]
-            # For simplicity in this function, we stick to the basic shift logic but updated for new lags
-            
-            # Helper to get value from N days ago (0-indexed relative to future_time)
-            # future_date is index 'len(df) + i - 1'
-            # value at 'len(df)' is pred[0]
-            
-            features = {
-                'day_of_week': future_date.dayofweek,
-                'month': future_date.month,
-                'is_weekend': 1 if future_date.dayofweek >= 5 else 0,
-                'day_of_month': future_date.day,
-                'sales_lag_7': last_row['sales'] if i <= 7 else predictions[-7]['predicted_demand'],
-                'sales_lag_14': last_row['sales_lag_7'] if i <= 14 else predictions[-14]['predicted_demand'],
-                'sales_lag_30': last_row['sales_lag_14'] if i <= 30 else predictions[-30]['predicted_demand'],
-                'rolling_mean_3': last_row.get('rolling_mean_3', 0),
-                'rolling_mean_5': last_row.get('rolling_mean_5', 0),
-                'rolling_mean_7': last_row.get('rolling_mean_7', 0),
-                'rolling_mean_30': last_row.get('rolling_mean_30', 0),
-                'rolling_mean_60': last_row.get('rolling_mean_60', 0),
-                'rolling_std_7': last_row.get('rolling_std_7', 0),
-                'trend': last_row['trend'] + i
-            }
+        n_products = len(product_ids)
+        lengths = np.array([len(frames[pid]) for pid in product_ids])
+        width = lengths.max()
+        last_rows = [frames[pid].iloc[-1] for pid in product_ids]
+        last = np.array([[r[col] for col in ROLLING_COLS + ['trend']] for r in last_rows], dtype=float)
+        last_dates = [r['date'] for r in last_rows]
+        
+        # Observed histories (right-aligned, zero padded) followed by the predictions
+        sales = np.zeros((n_products, width + days_ahead))
+        for row, pid in enumerate(product_ids):
+            sales[row, width - lengths[row]:width] = frames[pid]['sales'].to_numpy(dtype=float)
+        
+        static = (np.array([static_features[pid] for pid in product_ids]) if static_features
+                  else np.zeros((n_products, 0)))
+        n_features = len(FEATURE_COLS) + static.shape[1]
+        X = np.zeros((n_products, days_ahead, n_features))
+        X[:, :, len(FEATURE_COLS):] = static[:, None, :]
+        
+        # Calendar features, computed once per distinct last date
+        date_rows = {}
+        for row, last_date in enumerate(last_dates):
+            date_rows.setdefault(last_date, []).append(row)
+        future_dates = np.empty((n_products, days_ahead), dtype='datetime64[ns]')
+        for last_date, rows in date_rows.items():
+            dates = pd.date_range(last_date + timedelta(days=1), periods=days_ahead, freq='D')
+            future_dates[rows] = dates.values
+            X[rows, :, FEATURE_INDEX['day_of_week']] = dates.dayofweek
+            X[rows, :, FEATURE_INDEX['month']] = dates.month
+            X[rows, :, FEATURE_INDEX['is_weekend']] = dates.dayofweek >= 5
+            X[rows, :, FEATURE_INDEX['day_of_month']] = dates.day
+        X[:, :, FEATURE_INDEX['trend']] = last[:, -1:] + np.arange(1, days_ahead + 1)
+        
+        # Rolling statistics stay at the last observed window. In training they
+        # include the current day, so feeding predictions back in compounds error.
+        for i, col in enumerate(ROLLING_COLS):
+            X[:, :, FEATURE_INDEX[col]] = last[:, i:i + 1]
+        
+        # Constants for the fallback / damping filters
+        history_signal = last[:, ROLLING_COLS.index('rolling_mean_60')][:, None]
+        growth_cap = np.maximum(sales[:, :width].max(axis=1) * 1.8, 10)[:, None]
+        
+        # Products sharing a model instance are scored together
+        groups = {}
+        for row, pid in enumerate(product_ids):
+            groups.setdefault(id(models[pid]), (models[pid], []))[1].append(row)
+        
+        block = min(LAGS)
+        for start in range(0, days_ahead, block):
+            stop = min(start + block, days_ahead)
+            t = np.arange(width + start, width + stop)
+            for lag in LAGS:
+                X[:, start:stop, FEATURE_INDEX[f'sales_lag_{lag}']] = np.where(t >= lag, sales[:, np.maximum(t - lag, 0)], 0)
             
-            # Predict
-            X_future = pd.DataFrame([features])
-            X_future = X_future[feature_cols]
-            pred = self.best_model.predict(X_future)[0]
+            pred = np.empty((n_products, stop - start))
+            for model, rows in groups.values():
+                pred[rows] = model.predict(X[rows, start:stop].reshape(-1, n_features)).reshape(len(rows), -1)
 
             # --- NAIVE FALLBACK (The Zero-Fixer) ---
             # If the ML model is too conservative and predicts 0, 
             # but the product has a 60-day history (rolling_mean_60 > 0),
             # fall back to the 60-day average so we don't show 0.
-            history_signal = last_row.get('rolling_mean_60', 0)
-            if pred < 0.05 and history_signal > 0:
-                pred = history_signal * 0.95 # Use 95% of history as a safe floor
+            pred = np.where((pred < 0.05) & (history_signal > 0), history_signal * 0.95, pred) # Use 95% of history as a safe floor
             # ---------------------------------------
             
             # --- REALISM FILTER (Growth Damping) ---
-            max_hist_daily = df['sales'].max() if not df.empty else 1
-            growth_cap = max(max_hist_daily * 1.8, 10) 
-            pred = min(max(0, pred), growth_cap) 
-            
-            # Confidence interval
-            std = last_row['rolling_std_7']
-            
-            predictions.append({
-                'date': future_date,
-                'predicted_demand': float(pred),
-                'confidence_lower': float(max(0, pred - std)),
-                'confidence_upper': float(pred + std)
-            })
+            sales[:, width + start:width + stop] = np.clip(pred, 0, growth_cap)
         
-        return pd.DataFrame(predictions)
+        # Confidence interval
+        predicted = sales[:, width:]
+        std = last[:, ROLLING_COLS.index('rolling_std_7')][:, None]
+        return pd.DataFrame({
+            'product_id': np.repeat(product_ids, days_ahead),
+            'date': future_dates.ravel(),
+            'predicted_demand': predicted.ravel(),
+            'confidence_lower': np.maximum(0, predicted - std).ravel(),
+            'confidence_upper': (predicted + std).ravel()
+        })
     
-    def generate_forecasts(self, product_id: int, forecast_days: int = 30):
+    def fit_and_predict(self, product_id: int, df: pd.DataFrame, forecast_days: int = 30):
+        """
+        Train on a prepared sales history and forecast, without touching the database
+        """
+        if df['sales'].sum() == 0:
+            print(f"[WARN] No sales history for product {product_id}")
+            return None
+        
+        # Engineer features
+        df = self.engineer_features(df)
+        
+        # Train models
+        metrics = self.train_models(df)
+        
+        # Generate predictions
+        predictions_df = self.predict_future(df, days_ahead=forecast_days)
+        
+        return {
+            'product_id': product_id,
+            'model_used': self.best_model_name,
+            'metrics': metrics,
+            'predictions': predictions_df.to_dict('records')
+        }
+    
+    def generate_forecasts(self, product_id: int, forecast_days: int = 30, history: pd.DataFrame = None):
         """
         Complete forecasting pipeline for a product
         """
         try:
-            # Step 1: Prepare data
-            df = self.prepare_sales_history(product_id, days=60)
+            # Step 1: Prepare data (reuse a preloaded history when given)
+            df = history if history is not None else self.prepare_sales_history(product_id, days=60)
             
-            if df['sales'].sum() == 0:
-                print(f"[WARN] No sales history for product {product_id}")
+            # Step 2-4: Engineer features, train models and predict
+            result = self.fit_and_predict(product_id, df, forecast_days)
+            if result is None:
                 return None
             
-            # Step 2: Engineer features
-            df = self.engineer_features(df)
-            
-            # Step 3: Train models
-            metrics = self.train_models(df)
-            
-            # Step 4: Generate predictions
-            predictions_df = self.predict_future(df, days_ahead=forecast_days)
-            
             # Step 5: Save to database
-            self.save_forecasts(product_id, predictions_df)
+            self.save_forecasts(product_id, pd.DataFrame(result['predictions']))
             
-            return {
-                'product_id': product_id,
-                'model_used': self.best_model_name,
-                'metrics': metrics,
-                'predictions': predictions_df.to_dict('records')
-            }
+            return result
             
         except Exception as e:
             print(f"[ERROR] forecasting for product {product_id}: {e}")
             return None
     
-    def save_forecasts(self, product_id: int, predictions_df: pd.DataFrame):
+    def save_forecasts(self, product_id: int, predictions_df: pd.DataFrame, model_name: str = None, commit: bool = True):
         """
         Save predictions to database
         """
-        # Delete old forecasts for this product
-        self.db.query(forecast_models.DemandForecast).filter(
-            forecast_models.DemandForecast.product_id == product_id
-        ).delete()
-        
-        # Insert new forecasts
-        for _, row in predictions_df.iterrows():
-            forecast = forecast_models.DemandForecast(
-                product_id=product_id,
-                forecast_date=row['date'],
-                predicted_demand=row['predicted_demand'],
-                confidence_lower=row['confidence_lower'],
-                confidence_upper=row['confidence_upper'],
-                model_used=self.best_model_name
-            )
-            self.db.add(forecast)
-        
-        self.db.commit()
+        self.save_forecasts_bulk([{
+            'product_id': product_id,
+            'model_used': model_name or self.best_model_name,
+            'predictions': predictions_df.to_dict('records')
+        }], commit=commit)
     
-    def generate_stock_alerts(self, product_id: int):
+    def save_forecasts_bulk(self, results, commit: bool = True):
         """
-        Generate stock alerts based on predictions
+        Replace the forecasts of every result ({product_id, model_used,
+        predictions}) with one chunked bulk delete and one executemany insert
         """
-        product = self.db.query(models.Product).filter(models.Product.id == product_id).first()
-        if not product:
-            return
+        product_ids = [r['product_id'] for r in results]
+        for chunk in _chunks(product_ids):
+            self.db.query(forecast_models.DemandForecast).filter(
+                forecast_models.DemandForecast.product_id.in_(chunk)
+            ).delete(synchronize_session=False)
+            self.db.query(forecast_models.ForecastSeries).filter(
+                forecast_models.ForecastSeries.product_id.in_(chunk)
+            ).delete(synchronize_session=False)
         
-        # Get predictions for next 30 days
-        forecasts = self.db.query(forecast_models.DemandForecast).filter(
-            forecast_models.DemandForecast.product_id == product_id
-        ).order_by(forecast_models.DemandForecast.forecast_date).limit(30).all()
-        
-        if not forecasts:
-            return
+        self.db.bulk_insert_mappings(forecast_models.DemandForecast, [{
+            'product_id': r['product_id'],
+            'forecast_date': p['date'],
+            'predicted_demand': p['predicted_demand'],
+            'confidence_lower': p['confidence_lower'],
+            'confidence_upper': p['confidence_upper'],
+            'model_used': r['model_used']
+        } for r in results for p in r['predictions']])
+        self.db.bulk_insert_mappings(forecast_models.ForecastSeries, [
+            _series_mapping(r['product_id'], r['model_used'], r['predictions']) for r in results
+        ])
         
+        if commit:
+            self.db.commit()
+    
+    def _build_stock_alert(self, product: models.Product, demands) -> dict:
+        """
+        StockAlert values for a product given its next 30 daily predicted demands (None = no alert)
+        """
         # Calculate total predicted demand
-        total_demand_7 = sum([f.predicted_demand for f in forecasts[:7]])
-        total_demand_14 = sum([f.predicted_demand for f in forecasts[:14]])
-        total_demand_30 = sum([f.predicted_demand for f in forecasts[:30]])
+        total_demand_30 = sum(demands[:30])
         
         current_stock = product.stock_quantity
         
@@ -328,12 +687,6 @@ class DemandForecaster:
         avg_daily_demand = total_demand_30 / 30 if total_demand_30 > 0 else 0
         days_until_stockout = current_stock / avg_daily_demand if avg_daily_demand > 0 else 999
         
-        # Delete old alerts for this product
-        self.db.query(forecast_models.StockAlert).filter(
-            forecast_models.StockAlert.product_id == product_id,
-            forecast_models.StockAlert.status == "active"
-        ).delete()
-        
         # Generate alert if needed
         alert_type = None
         message = None
@@ -352,31 +705,429 @@ class DemandForecaster:
             message = f"ℹ️ INFO: {product.name} - Consider reordering soon."
             recommended_qty = int(round(total_demand_30))
         
-        if alert_type:
-            alert = forecast_models.StockAlert(
-                product_id=product_id,
-                alert_type=alert_type,
-                message=message,
-                recommended_order_qty=recommended_qty,
-                days_until_stockout=int(days_until_stockout)
-            )
-            self.db.add(alert)
+        if not alert_type:
+            return None
+        return {
+            'product_id': product.id,
+            'alert_type': alert_type,
+            'message': message,
+            'recommended_order_qty': recommended_qty,
+            'days_until_stockout': int(days_until_stockout)
+        }
+    
+    def generate_stock_alerts(self, product_id: int, commit: bool = True):
+        """
+        Generate stock alerts based on predictions
+        """
+        product = self.db.query(models.Product).filter(models.Product.id == product_id).first()
+        if not product:
+            return
+        
+        # Get predictions for next 30 days
+        forecasts = self.db.query(forecast_models.DemandForecast).filter(
+            forecast_models.DemandForecast.product_id == product_id
+        ).order_by(forecast_models.DemandForecast.forecast_date).limit(30).all()
+        
+        if not forecasts:
+            return
+        
+        # Delete old alerts for this product
+        self.db.query(forecast_models.StockAlert).filter(
+            forecast_models.StockAlert.product_id == product_id,
+            forecast_models.StockAlert.status == "active"
+        ).delete()
+        
+        alert = self._build_stock_alert(product, [f.predicted_demand for f in forecasts])
+        if alert:
+            self.db.add(forecast_models.StockAlert(**alert))
+        
+        if commit:
             self.db.commit()
+    
+    def generate_stock_alerts_bulk(self, results, commit: bool = True):
+        """
+        Stock alerts for every result, computed from the in-memory predictions
+        with one product fetch, one bulk delete and one bulk insert
+        """
+        results = [r for r in results if r['predictions']]
+        product_ids = [r['product_id'] for r in results]
+        products = {}
+        for chunk in _chunks(product_ids):
+            products.update({p.id: p for p in self.db.query(models.Product).filter(models.Product.id.in_(chunk))})
+            self.db.query(forecast_models.StockAlert).filter(
+                forecast_models.StockAlert.product_id.in_(chunk),
+                forecast_models.StockAlert.status == "active"
+            ).delete(synchronize_session=False)
+        
+        alerts = []
+        for r in results:
+            product = products.get(r['product_id'])
+            if product is None:
+                continue
+            demands = [p['predicted_demand'] for p in sorted(r['predictions'], key=lambda p: p['date'])]
+            alert = self._build_stock_alert(product, demands)
+            if alert:
+                alerts.append(alert)
+        self.db.bulk_insert_mappings(forecast_models.StockAlert, alerts)
+        
+        if commit:
+            self.db.commit()
+
+
+def _chunks(values, size: int = 500):
+    """
+    Split values for IN (...) clauses (SQLite caps bound parameters per statement)
+    """
+    values = list(values)
+    return [values[i:i + size] for i in range(0, len(values), size)]
+
+
+def _train_products(chunk, dates: pd.DatetimeIndex, forecast_days: int = 30, progress=None):
+    """
+    Process pool worker: fit each (product_id, name, sales, rf_params) of a
+    chunk from its pre-aggregated series, then forecast the whole chunk with
+    batched predicts. Returns (results, {product_id: training seconds}).
+    """
+    forecaster = DemandForecaster(db=None)
+    frames, fitted, results, durations = {}, {}, {}, {}
+    if not chunk:
+        return [], durations
+    features = engineer_panel_features(np.vstack([sales for _, _, sales, _ in chunk]), dates)
+    for row, (product_id, name, sales, rf_params) in enumerate(chunk):
+        started = time.perf_counter()
+        try:
+            print(f"\n📊 Training model for: {name}")
+            if sales.sum() == 0:
+                print(f"[WARN] No sales history for product {product_id}")
+                continue
+            df = _panel_frame(features[row], dates, sales)
+            metrics = forecaster.train_models(df, rf_params=rf_params)
+            frames[product_id] = df
+            fitted[product_id] = forecaster.best_model
+            results[product_id] = {
+                'product_id': product_id,
+                'model_used': forecaster.best_model_name,
+                'metrics': metrics,
+                'artifact': model_registry.artifact_path(product_id)
+            }
+            model_registry.save_model(forecaster.best_model, results[product_id]['artifact'])
+        except Exception as e:
+            print(f"[ERROR] forecasting for product {product_id}: {e}")
+            results.pop(product_id, None)
+            frames.pop(product_id, None)
+            fitted.pop(product_id, None)
+        finally:
+            durations[product_id] = time.perf_counter() - started
+            if progress is not None:
+                progress.product_done(product_id, durations[product_id])
+    
+    predictions = forecaster.predict_future_batch(frames, fitted, days_ahead=forecast_days)
+    return _attach_predictions(list(results.values()), predictions), durations
+
+
+def _attach_predictions(results, predictions: pd.DataFrame):
+    """
+    Split a long predict_future_batch frame into each result's 'predictions' records
+    """
+    by_product = {result['product_id']: result for result in results}
+    for result in results:
+        result['predictions'] = []
+    for record in predictions.to_dict('records'):
+        by_product[record.pop('product_id')]['predictions'].append(record)
+    return results
+
+
+def _static_features(category: str, categories) -> tuple:
+    """
+    One-hot category of a product for the global model (all zeros for a category it was not trained on)
+    """
+    category = category or ''
+    return tuple(float(category == known) for known in categories)
+
+
+def _train_global(items, dates: pd.DatetimeIndex, categories, forecast_days: int = 30):
+    """
+    Fit one pooled model over every (product_id, name, sales, category) and
+    forecast all products with it, including those without sales yet
+    """
+    if not items:
+        return []
+    forecaster = DemandForecaster(db=None)
+    values = np.vstack([sales for _, _, sales, _ in items])
+    features = engineer_panel_features(values, dates)
+    frames, static_features = {}, {}
+    for row, (product_id, _, sales, category) in enumerate(items):
+        frames[product_id] = _panel_frame(features[row], dates, sales)
+        static_features[product_id] = _static_features(category, categories)
+    
+    metrics = forecaster.train_global_model(features, values, list(static_features.values()))
+    model_registry.save_model(forecaster.best_model, model_registry.artifact_path())
+    predictions = forecaster.predict_future_batch(frames, forecaster.best_model, forecast_days, static_features)
+    
+    results = [{
+        'product_id': pid,
+        'model_used': forecaster.best_model_name,
+        'metrics': metrics
+    } for pid in frames]
+    return _attach_predictions(results, predictions)
+
+
+def _train_per_product(items, dates: pd.DatetimeIndex, workers: int, progress=None):
+    """
+    Fit per-product models, spread over a process pool when workers > 1
+    """
+    if workers <= 1:
+        return _train_products(items, dates, 30, progress)[0]
+    
+    print(f"\n📊 Training {len(items)} products on {workers} workers")
+    results = []
+    chunk_size = max(1, -(-len(items) // (workers * 4)))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [
+            pool.submit(_train_products, items[i:i + chunk_size], dates, 30)
+            for i in range(0, len(items), chunk_size)
+        ]
+        for future in as_completed(futures):
+            chunk_results, durations = future.result()
+            results.extend(chunk_results)
+            if progress is not None:
+                for product_id, seconds in durations.items():
+                    progress.product_done(product_id, seconds)
+    return results
+
+
+def _hyperparameter_key(product: models.Product) -> str:
+    """
+    Cache key for a product's hyperparameters (FORECAST_HPARAM_SCOPE=category shares them)
+    """
+    if os.getenv("FORECAST_HPARAM_SCOPE", "product") == "category":
+        return f"category:{product.category}"
+    return f"product:{product.id}"
+
+
+def _plan_hyperparameter_searches(items, keys: dict, cache: dict) -> dict:
+    """
+    Pick Random Forest params per product: None (grid search) for entries
+    that are missing, older than FORECAST_HPARAM_MAX_AGE_DAYS or flagged
+    for drift, up to FORECAST_SEARCH_BUDGET searches per retrain (missing
+    and oldest first); cached or default params for everything else
+    """
+    max_age = timedelta(days=int(os.getenv("FORECAST_HPARAM_MAX_AGE_DAYS", "7")))
+    budget = int(os.getenv("FORECAST_SEARCH_BUDGET", "25"))
+    now = datetime.utcnow()
+    
+    def last_search(product_id):
+        entry = cache.get(keys[product_id])
+        return entry.searched_at if entry and entry.searched_at else datetime.min
+    
+    plan, planned_keys = {}, set()
+    for product_id, _, sales in sorted(items, key=lambda item: last_search(item[0])):
+        key = keys[product_id]
+        entry = cache.get(key)
+        due = now - last_search(product_id) > max_age
+        if due and budget > 0 and key not in planned_keys and sales.sum() > 0:
+            plan[product_id] = None
+            planned_keys.add(key)
+            budget -= 1
+        elif entry is not None:
+            plan[product_id] = json.loads(entry.params)
+        else:
+            plan[product_id] = dict(DEFAULT_RF_PARAMS)
+    return plan
+
+
+def _store_hyperparameters(db: Session, results, keys: dict, cache: dict):
+    """
+    Save fresh search winners and flag entries whose RMSE drifted beyond
+    FORECAST_HPARAM_DRIFT (relative) so the next retrain searches them again
+    """
+    tolerance = float(os.getenv("FORECAST_HPARAM_DRIFT", "0.25"))
+    for result in results:
+        metrics = result['metrics']
+        key = keys[result['product_id']]
+        entry = cache.get(key)
+        if metrics['rf_searched']:
+            if entry is None:
+                entry = cache[key] = forecast_models.ForecastHyperparameters(cache_key=key)
+                db.add(entry)
+            entry.params = json.dumps(metrics['rf_params'])
+            entry.rmse = float(metrics['rf_rmse'])
+            entry.searched_at = datetime.utcnow()
+        elif entry is not None and entry.rmse and metrics['rf_rmse'] > entry.rmse * (1 + tolerance):
+            print(f">> RF accuracy drifted for {key} (RMSE {entry.rmse:.2f} -> {metrics['rf_rmse']:.2f}), search scheduled")
+            entry.searched_at = None
 
 
-def train_all_products(db: Session):
+def train_all_products(db: Session, workers: int = None, mode: str = None, progress=None, full: bool = False):
     """
     Train forecasting models for all products
+
+    mode "per_product" (default, or FORECAST_MODE) fits one model per product,
+    in a process pool when workers > 1 (or FORECAST_WORKERS set), with Random
+    Forest hyperparameters from the cache and a bounded number of grid
+    searches per run; mode "global" fits a single pooled model once.
+    Forecasts and alerts are written by the caller in one transaction.
+
+    Per-product runs are incremental unless full=True: products whose sales
+    watermark matches their registered model are not refitted, their saved
+    model just rolls the forecast forward to today.
+
+    progress, if given, gets set_total(n) once and product_done(product_id,
+    seconds) as each product finishes (see training_jobs.TrainingJob).
     """
-    forecaster = DemandForecaster(db)
-    products = db.query(models.Product).all()
+    if workers is None:
+        workers = int(os.getenv("FORECAST_WORKERS", "1"))
+    if mode is None:
+        mode = os.getenv("FORECAST_MODE", "per_product")
+    if mode not in ("per_product", "global"):
+        raise ValueError(f"Unknown forecasting mode: {mode}")
+    
+    products = db.query(models.Product).order_by(models.Product.id).all()
+    sales = load_sales_matrix(db, days=60, product_ids=[p.id for p in products])
+    
+    items = [(p.id, p.name, sales.values[sales.index[p.id]]) for p in products]
+    if progress is not None:
+        progress.set_total(len(items))
+    
+    window = {'train_start': sales.dates[0].to_pydatetime(), 'train_end': sales.dates[-1].to_pydatetime()}
     
     results = []
-    for product in products:
-        print(f"\n📊 Training model for: {product.name}")
-        result = forecaster.generate_forecasts(product.id, forecast_days=30)
-        if result:
-            forecaster.generate_stock_alerts(product.id)
-            results.append(result)
+    if mode == "global":
+        print(f"\n📊 Training global model for {len(products)} products")
+        categories = sorted({p.category or '' for p in products})
+        started = time.perf_counter()
+        results = _train_global([item + (p.category,) for item, p in zip(items, products)], sales.dates, categories, 30)
+        if progress is not None:
+            seconds = (time.perf_counter() - started) / max(len(items), 1)
+            for product in products:
+                progress.product_done(product.id, seconds)
+        if results:
+            model_registry.register_models(db, [dict(
+                product_id=None, model_name=results[0]['model_used'], artifact_path=model_registry.artifact_path(),
+                features=global_feature_cols(categories), metrics=results[0]['metrics'],
+                settings={'categories': categories}, **window
+            )], global_model=True)
+    else:
+        # Skip products with no sales changes since their model was trained
+        registered = {} if full else model_registry.get_registered_models(db)
+        watermarks = _sales_watermarks(db)
+        unchanged = [
+            p for p in products
+            if _has_usable_model(registered.get(p.id))
+            and registered[p.id].last_order_item_id is not None
+            and (registered[p.id].last_order_item_id, registered[p.id].units_sold) == watermarks.get(p.id, (0, 0))
+        ]
+        if unchanged:
+            print(f"\n♻️ {len(unchanged)} products unchanged since their last training, reusing models")
+            unchanged_ids = {p.id for p in unchanged}
+            items = [item for item in items if item[0] not in unchanged_ids]
+            if progress is not None:
+                for product in unchanged:
+                    progress.product_done(product.id, 0.0)
+        
+        keys = {p.id: _hyperparameter_key(p) for p in products}
+        cache = {e.cache_key: e for e in db.query(forecast_models.ForecastHyperparameters).all()}
+        rf_params = _plan_hyperparameter_searches(items, keys, cache)
+        items = [item + (rf_params[item[0]],) for item in items]
+        results = _train_per_product(items, sales.dates, workers, progress)
+        
+        # Unchanged models trained on an earlier day roll their horizon forward.
+        # Predict before the first write below: SQLite takes its write lock on the
+        # first DELETE/UPDATE, and checkouts would wait on it while models load.
+        stale = [p for p in unchanged if registered[p.id].train_end is None
+                 or registered[p.id].train_end.date() < sales.dates[-1].date()]
+        rolled = _predict_registered(db, stale, sales, registered)
+        
+        _store_hyperparameters(db, results, keys, cache)
+        model_registry.register_models(db, [dict(
+            product_id=r['product_id'], model_name=r['model_used'], artifact_path=r.pop('artifact'),
+            features=FEATURE_COLS, metrics=r['metrics'], **window,
+            watermark=watermarks.get(r['product_id'], (0, 0))
+        ) for r in results])
+        results += rolled
+    
+    return _persist_results(db, results)
+
+
+def refresh_forecasts(db: Session, forecast_days: int = 30):
+    """
+    Predict-only path: reload the registered models and refresh forecasts
+    and alerts from the latest sales, without refitting anything
+    """
+    registered = model_registry.get_registered_models(db)
+    if not registered:
+        return []
+    
+    products = db.query(models.Product).order_by(models.Product.id).all()
+    sales = load_sales_matrix(db, days=60, product_ids=[p.id for p in products])
+    return _persist_results(db, _predict_registered(db, products, sales, registered, forecast_days))
+
+
+def _predict_registered(db: Session, products, sales: SalesMatrix, registered: dict, forecast_days: int = 30):
+    """
+    Forecast products with their registered models (or the registered global
+    model) in one batched pass; products without a usable model are skipped
+    """
+    forecaster = DemandForecaster(db)
+    frames, fitted, static_features, results = {}, {}, None, []
+    global_record = registered.get(None)
+    if global_record is not None:
+        categories = json.loads(global_record.settings).get('categories', [])
+        if json.loads(global_record.features) != global_feature_cols(categories):
+            print("[WARN] Registered global model uses other features; retrain required")
+            return []
+        model = model_registry.load_model(global_record.artifact_path)
+        static_features = {}
+        features = engineer_panel_features(sales.values[[sales.index[p.id] for p in products]], sales.dates)
+        for row, product in enumerate(products):
+            frames[product.id] = _panel_frame(features[row], sales.dates, sales.values[sales.index[product.id]])
+            fitted[product.id] = model
+            static_features[product.id] = _static_features(product.category, categories)
+            results.append({'product_id': product.id, 'model_used': global_record.model_name})
+    else:
+        products = [p for p in products if _has_usable_model(registered.get(p.id))
+                    and sales.values[sales.index[p.id]].sum() > 0]
+        features = engineer_panel_features(sales.values[[sales.index[p.id] for p in products]], sales.dates)
+        for row, product in enumerate(products):
+            record = registered[product.id]
+            frames[product.id] = _panel_frame(features[row], sales.dates, sales.values[sales.index[product.id]])
+            fitted[product.id] = model_registry.load_model(record.artifact_path)
+            results.append({'product_id': product.id, 'model_used': record.model_name})
+    
+    predictions = forecaster.predict_future_batch(frames, fitted, forecast_days, static_features)
+    return _attach_predictions(results, predictions)
+
+
+def _has_usable_model(record) -> bool:
+    """
+    Whether a per-product registry record can still be loaded and fed our features
+    """
+    return (record is not None and json.loads(record.features) == FEATURE_COLS
+            and os.path.exists(record.artifact_path))
+
+
+def _sales_watermarks(db: Session) -> dict:
+    """
+    Per-product change markers: (last order_item id, units in the sales rollup).
+    New orders move the first, deletions and cancellations the second.
+    """
+    last_items = dict(db.query(
+        models.OrderItem.product_id, func.max(models.OrderItem.id)
+    ).group_by(models.OrderItem.product_id).all())
+    units = dict(db.query(
+        forecast_models.SalesHistory.product_id, func.sum(forecast_models.SalesHistory.quantity_sold)
+    ).group_by(forecast_models.SalesHistory.product_id).all())
+    return {pid: (last_items.get(pid) or 0, int(units.get(pid) or 0)) for pid in set(last_items) | set(units)}
+
+
+def _persist_results(db: Session, results):
+    """
+    Write forecasts and stock alerts of all results in one transaction
+    """
+    forecaster = DemandForecaster(db)
+    results.sort(key=lambda r: r['product_id'])
+    forecaster.save_forecasts_bulk(results, commit=False)
+    forecaster.generate_stock_alerts_bulk(results, commit=False)
+    db.commit()
     
     return results
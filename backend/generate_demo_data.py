@@ -5,6 +5,8 @@ from datetime import datetime, timedelta
 import random
 from sqlalchemy.orm import Session
 import models
+import crud
+import dashboard_metrics
 from database import SessionLocal
 
 def generate_demo_sales_data(days: int = 60):
@@ -87,6 +89,8 @@ def generate_demo_sales_data(days: int = 60):
                 order.total_amount = total
         
         db.commit()
+        crud.rebuild_sales_history(db)
+        dashboard_metrics.reconcile(db)
         print(f"Generated demo sales data for {days} days!")
         
     except Exception as e:
@@ -4,21 +4,53 @@ import os
 # Fix for Windows uvicorn reloader finding logic
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
-from fastapi import FastAPI, Depends, HTTPException
+import json
+from datetime import date, datetime
+from fastapi import FastAPI, Depends, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import Response, StreamingResponse
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
 import crud, models, schemas
 from database import SessionLocal, engine
-from pydantic import BaseModel
+from pydantic import BaseModel, ValidationError
 import forecasting
 import forecast_models
+import training_jobs
+import response_cache
+import dashboard_metrics
 import chatbot
 
+try:
+    import msgpack  # Optional: only needed for msgpack encoded responses
+except ImportError:
+    msgpack = None
+
 # Create the database tables
 models.Base.metadata.create_all(bind=engine)
 forecast_models.Base.metadata.create_all(bind=engine)
 
+# create_all skips tables that already exist, so add indexes introduced later
+for table in [models.Order.__table__, models.OrderItem.__table__, forecast_models.SalesHistory.__table__,
+              forecast_models.DemandForecast.__table__]:
+    for index in table.indexes:
+        index.create(bind=engine, checkfirst=True)
+
+# Build the daily sales rollup for databases that predate it
+with SessionLocal() as db:
+    crud.backfill_sales_history(db)
+    forecasting.backfill_forecast_series(db)
+    dashboard_metrics.backfill(db)
+
+# Periodically recompute the dashboard totals from orders and products
+dashboard_metrics.start_reconciler(SessionLocal)
+
+# Create the shared Gemini client once
+chatbot.init_model()
+
 app = FastAPI(title="E-commerce AI Backend")
 
 # CORS setup
@@ -35,8 +67,12 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
+# Compress larger responses (e.g. forecasting predictions) for clients that accept gzip
+app.add_middleware(GZipMiddleware, minimum_size=1000)
+
 # Dependency
 def get_db():
     db = SessionLocal()
@@ -53,17 +89,40 @@ def read_root():
 def create_product(product: schemas.ProductCreate, db: Session = Depends(get_db)):
     return crud.create_product(db=db, product=product)
 
+def _cached_response(request: Request, key, build):
+    """
+    Serve key from the catalog cache (304 when If-None-Match matches),
+    otherwise render build() to JSON and cache it
+    """
+    cache = response_cache.catalog_cache
+    cached = cache.get(key)
+    if cached is None:
+        version = cache.version
+        body = json.dumps(jsonable_encoder(build())).encode()
+        etag = cache.set(key, body, version)
+    else:
+        body, etag = cached
+    
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if response_cache.etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
 @app.get("/products/", response_model=List[schemas.Product])
-def read_products(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    products = crud.get_products(db, skip=skip, limit=limit)
-    return products
+def read_products(request: Request, skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
+    return _cached_response(request, ("products", skip, limit), lambda: [
+        schemas.Product.model_validate(p, from_attributes=True) for p in crud.get_products(db, skip=skip, limit=limit)
+    ])
 
 @app.get("/products/{product_id}", response_model=schemas.Product)
-def read_product(product_id: int, db: Session = Depends(get_db)):
-    db_product = crud.get_product(db, product_id=product_id)
-    if not db_product:
-        raise HTTPException(status_code=404, detail="Product not found")
-    return db_product
+def read_product(request: Request, product_id: int, db: Session = Depends(get_db)):
+    def build():
+        db_product = crud.get_product(db, product_id=product_id)
+        if not db_product:
+            raise HTTPException(status_code=404, detail="Product not found")
+        return schemas.Product.model_validate(db_product, from_attributes=True)
+    
+    return _cached_response(request, ("product", product_id), build)
 
 
 
@@ -103,40 +162,115 @@ def create_order(order: schemas.OrderCreate, db: Session = Depends(get_db)):
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
+def _parse_bulk_order(index: int, payload, failed: list):
+    try:
+        return schemas.OrderCreate.model_validate(payload)
+    except ValidationError as e:
+        # One "field: message" per problem, without pydantic's per-field doc links
+        summary = "; ".join(f"{'.'.join(str(part) for part in error['loc']) or 'order'}: {error['msg']}"
+                            for error in e.errors(include_url=False))
+        failed.append({"index": index, "error": summary})
+        return None
+
+@app.post("/orders/bulk")
+async def create_orders_bulk(request: Request, db: Session = Depends(get_db)):
+    """
+    Import many orders: a JSON array of OrderCreate payloads, or NDJSON
+    (Content-Type: application/x-ndjson, one payload per line) which is
+    processed while it streams in. Orders are written in chunked
+    transactions; a bad or unfillable order is reported in "failed" (by its
+    0-based position) without aborting the rest.
+    """
+    created, failed = [], []
+    batch = []
+    
+    async def flush():
+        result = await run_in_threadpool(crud.create_orders_bulk, db, batch[:])
+        created.extend(result[0])
+        failed.extend(result[1])
+        batch.clear()
+    
+    if "ndjson" in request.headers.get("content-type", ""):
+        index, pending = 0, b""
+        async for data in request.stream():
+            *lines, pending = (pending + data).split(b"\n")
+            for line in lines:
+                if not line.strip():
+                    continue
+                try:
+                    order = _parse_bulk_order(index, json.loads(line), failed)
+                except ValueError as e:
+                    order = None
+                    failed.append({"index": index, "error": f"Invalid JSON: {e}"})
+                if order is not None:
+                    batch.append((index, order))
+                index += 1
+                if len(batch) >= crud.BULK_ORDER_CHUNK:
+                    await flush()
+        if pending.strip():
+            try:
+                order = _parse_bulk_order(index, json.loads(pending), failed)
+            except ValueError as e:
+                order = None
+                failed.append({"index": index, "error": f"Invalid JSON: {e}"})
+            if order is not None:
+                batch.append((index, order))
+    else:
+        try:
+            payloads = json.loads(await request.body())
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Body must be a JSON array or NDJSON")
+        if not isinstance(payloads, list):
+            raise HTTPException(status_code=400, detail="Body must be a JSON array or NDJSON")
+        for index, payload in enumerate(payloads):
+            order = _parse_bulk_order(index, payload, failed)
+            if order is not None:
+                batch.append((index, order))
+    
+    if batch:
+        await flush()
+    
+    failed.sort(key=lambda f: f["index"])
+    return {
+        "created": len(created),
+        "failed_count": len(failed),
+        "order_ids": [order_id for _, order_id in sorted(created)],
+        "failed": failed
+    }
+
 @app.get("/orders/", response_model=List[schemas.Order])
-def read_orders(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
+def read_orders(
+    response: Response,
+    skip: int = 0,
+    limit: int = 100,
+    before_id: Optional[int] = None,
+    status: Optional[str] = None,
+    customer_email: Optional[str] = None,
+    created_from: Optional[datetime] = None,
+    created_to: Optional[datetime] = None,
+    db: Session = Depends(get_db)
+):
+    """
+    Orders newest first. For the next page pass the X-Next-Cursor header as
+    before_id (keyset pagination; skip still works but scans skipped rows).
+    created_from is inclusive, created_to exclusive.
+    """
     # In a real app, verify admin token here
-    orders = db.query(models.Order).order_by(models.Order.id.desc()).offset(skip).limit(limit).all()
+    orders = crud.get_orders(db, skip=skip, limit=limit, before_id=before_id, status=status,
+                             customer_email=customer_email, created_from=created_from, created_to=created_to)
+    if orders and len(orders) == limit:
+        response.headers["X-Next-Cursor"] = str(orders[-1].id)
     return orders
 
 @app.get("/admin/stats", response_model=OrderStats)
 def get_admin_stats(db: Session = Depends(get_db)):
-    from sqlalchemy import func
-    from datetime import datetime
-    
-    # 1. Basic counts
-    total_orders = db.query(func.count(models.Order.id)).scalar()
-    total_products = db.query(func.count(models.Product.id)).scalar()
+    # 1. Totals, counts and this month's sales (maintained by the CRUD paths)
+    stats = dashboard_metrics.read(db)
     
-    # 2. Total Sales
-    total_sales = db.query(func.sum(models.Order.total_amount)).scalar() or 0
+    # 2. Recent Orders (Latest 10)
+    stats["recent_orders"] = crud.get_orders(db, limit=10)
     
-    # 3. Monthly Sales
-    now = datetime.utcnow()
-    month_start = datetime(now.year, now.month, 1)
-    monthly_sales = db.query(func.sum(models.Order.total_amount))\
-        .filter(models.Order.created_at >= month_start).scalar() or 0
-    
-    # 4. Recent Orders (Latest 10)
-    recent_orders = db.query(models.Order).order_by(models.Order.id.desc()).limit(10).all()
-    
-    return {
-        "total_sales": total_sales,
-        "monthly_sales": monthly_sales,
-        "total_orders": total_orders,
-        "total_products": total_products,
-        "recent_orders": recent_orders
-    }
+    return stats
 
 @app.put("/orders/{order_id}/status", response_model=schemas.Order)
 def update_order_status(order_id: int, status_update: schemas.OrderStatusUpdate, db: Session = Depends(get_db)):
@@ -154,29 +288,16 @@ def delete_order(order_id: int, db: Session = Depends(get_db)):
 
 @app.put("/products/{product_id}", response_model=schemas.Product)
 def update_product(product_id: int, product_update: schemas.ProductCreate, db: Session = Depends(get_db)):
-    db_product = db.query(models.Product).filter(models.Product.id == product_id).first()
+    db_product = crud.update_product(db, product_id, product_update)
     if not db_product:
         raise HTTPException(status_code=404, detail="Product not found")
-    
-    # Basic cleanup: remove trailing/leading spaces from name
-    if product_update.name:
-        product_update.name = product_update.name.strip()
-        
-    for key, value in product_update.dict().items():
-        setattr(db_product, key, value)
-    
-    db.commit()
-    db.refresh(db_product)
     return db_product
 
 @app.delete("/products/{product_id}")
 def delete_product(product_id: int, db: Session = Depends(get_db)):
-    db_product = db.query(models.Product).filter(models.Product.id == product_id).first()
-    if not db_product:
+    success = crud.delete_product(db, product_id=product_id)
+    if not success:
         raise HTTPException(status_code=404, detail="Product not found")
-    
-    db.delete(db_product)
-    db.commit()
     return {"message": "Product deleted successfully"}
 
 # --- AI Chatbot Endpoint ---
@@ -185,65 +306,160 @@ class ChatRequest(BaseModel):
     message: str
 
 @app.post("/chat/message")
-def chat_message(chat: ChatRequest, db: Session = Depends(get_db)):
-    # 1. Get response from Gemini (with RAG context)
-    ai_reply = chatbot.get_chat_response(db, chat.message)
+async def chat_message(chat: ChatRequest, db: Session = Depends(get_db)):
+    # 1. Get response from Gemini (with RAG context), without blocking the event loop
+    ai_reply = await chatbot.get_chat_response(db, chat.message)
     return {"reply": ai_reply}
 
+@app.post("/chat/stream")
+async def chat_stream(chat: ChatRequest, db: Session = Depends(get_db)):
+    """
+    Server-Sent Events: a `data: {"delta": ...}` event per chunk of the reply
+    as the model generates it, then `event: done` with the full reply
+    """
+    async def events():
+        reply = []
+        async for delta in chatbot.stream_chat_response(db, chat.message):
+            reply.append(delta)
+            yield f"data: {json.dumps({'delta': delta})}\n\n"
+        yield f"event: done\ndata: {json.dumps({'reply': ''.join(reply).strip()})}\n\n"
+    
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
 
 # --- Demand Forecasting Endpoints ---
 
-@app.post("/forecasting/train")
-def train_forecasting_models(db: Session = Depends(get_db)):
-    """Train ML models for all products"""
+@app.post("/forecasting/train", status_code=202)
+def train_forecasting_models(workers: Optional[int] = None, mode: Optional[str] = None, full: bool = False):
+    """Queue a retrain (mode=global fits one pooled model, workers > 1 trains in a process pool,
+    full=true refits products without new sales too)"""
+    if mode not in (None, "per_product", "global"):
+        raise HTTPException(status_code=400, detail=f"Unknown forecasting mode: {mode}")
+    job = training_jobs.submit(workers=workers, mode=mode, full=full)
+    return {
+        "message": "Forecasting training job queued",
+        "job_id": job.id,
+        "status": job.status
+    }
+
+
+@app.get("/forecasting/jobs/{job_id}")
+def get_training_job(job_id: str):
+    """Progress of a training job: products done/total, ETA and per-product durations"""
+    job = training_jobs.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Training job not found")
+    return job.to_dict()
+
+
+@app.post("/forecasting/refresh")
+def refresh_forecasting_predictions(db: Session = Depends(get_db)):
+    """Refresh forecasts from the latest sales with the saved models (no retraining)"""
     try:
-        # Create tables if they don't exist
-        # forecast_models.Base.metadata.create_all(bind=engine) # Already done at startup
-        
-        results = forecasting.train_all_products(db)
+        results = forecasting.refresh_forecasts(db)
         return {
-            "message": "Forecasting models trained successfully",
-            "products_trained": len(results),
-            "results": results
+            "message": "Forecasts refreshed from saved models",
+            "products_refreshed": len(results)
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+MSGPACK_TYPES = ("application/msgpack", "application/x-msgpack")
+MAX_PREDICTIONS_PAGE = 1000
+
+
+def _stream_json_array(records, batch_size: int = 200):
+    """Encode records as one JSON array, a batch of records per chunk"""
+    yield "["
+    batch, first = [], True
+    for record in records:
+        batch.append(json.dumps(record))
+        if len(batch) == batch_size:
+            yield ("" if first else ",") + ",".join(batch)
+            batch, first = [], False
+    if batch:
+        yield ("" if first else ",") + ",".join(batch)
+    yield "]"
+
+
+def _stream_msgpack_array(records, count: int):
+    """Encode records as one msgpack array of maps"""
+    packer = msgpack.Packer()
+    yield packer.pack_array_header(count)
+    for record in records:
+        yield packer.pack(record)
+
+
 @app.get("/forecasting/predictions")
-def get_all_predictions(db: Session = Depends(get_db)):
-    """Get predictions for all products, returning empty predictions for those without history"""
-    # 1. Get ALL products first
-    products = db.query(models.Product).all()
+def get_all_predictions(
+    request: Request,
+    format: str = "rows",
+    category: Optional[str] = None,
+    alert_level: Optional[str] = None,
+    product_ids: Optional[List[int]] = Query(None),
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    after_id: Optional[int] = None,
+    limit: Optional[int] = None,
+    db: Session = Depends(get_db)
+):
+    """
+    Get predictions for all products, returning empty predictions for those without history.
     
-    # 2. Get ALL forecasts
-    forecasts = db.query(forecast_models.DemandForecast).all()
+    format=rows (default) nests one object per forecast day; format=columnar
+    returns per-product arrays (predicted_demand, confidence_lower,
+    confidence_upper) with day i at start_date + i days.
     
-    # 3. Optimize lookup
-    forecast_map = {}
-    for f in forecasts:
-        if f.product_id not in forecast_map:
-            forecast_map[f.product_id] = []
-        
-        forecast_map[f.product_id].append({
-            "date": f.forecast_date.isoformat(),
-            "predicted_demand": f.predicted_demand,
-            "confidence_lower": f.confidence_lower,
-            "confidence_upper": f.confidence_upper,
-            "model_used": f.model_used
-        })
+    category, alert_level (active stock alert type), product_ids and the
+    start_date/end_date forecast window filter in SQL. With limit, products
+    are paged by id: pass the X-Next-Cursor response header back as after_id
+    (no header = last page).
+    
+    The response is streamed as a JSON array (gzip compressed when accepted),
+    as NDJSON when the Accept header asks for application/x-ndjson, or as
+    msgpack for application/msgpack.
+    """
+    if format not in ("rows", "columnar"):
+        raise HTTPException(status_code=400, detail="format must be 'rows' or 'columnar'")
+    if alert_level and alert_level not in forecasting.ALERT_LEVELS:
+        raise HTTPException(status_code=400, detail=f"alert_level must be one of {', '.join(forecasting.ALERT_LEVELS)}")
+    if limit is not None and not 1 <= limit <= MAX_PREDICTIONS_PAGE:
+        raise HTTPException(status_code=400, detail=f"limit must be between 1 and {MAX_PREDICTIONS_PAGE}")
+    
+    criteria = forecasting.prediction_filters(category, alert_level, product_ids)
+    if after_id is not None:
+        criteria.append(models.Product.id > after_id)
+    
+    headers = {}
+    count = None
+    if limit is not None:
+        page = [pid for pid, in db.query(models.Product.id).filter(*criteria)
+                .order_by(models.Product.id).limit(limit + 1)]
+        if len(page) > limit:
+            page = page[:limit]
+            headers["X-Next-Cursor"] = str(page[-1])
+        count = len(page)
+        criteria.append(models.Product.id <= (page[-1] if page else -1))
+    
+    records = forecasting.iter_prediction_records(
+        db, columnar=format == "columnar", criteria=criteria, start_date=start_date, end_date=end_date
+    )
     
-    # 4. Construct response including ALL products
-    results = []
-    for product in products:
-        results.append({
-            "product_id": product.id,
-            "product_name": product.name,
-            "current_stock": product.stock_quantity,
-            "predictions": forecast_map.get(product.id, [])  # Empty list if no forecasts
-        })
+    accept = request.headers.get("accept", "")
+    if "application/x-ndjson" in accept:
+        return StreamingResponse((json.dumps(r) + "\n" for r in records),
+                                 media_type="application/x-ndjson", headers=headers)
+    if any(t in accept for t in MSGPACK_TYPES):
+        if msgpack is None:
+            raise HTTPException(status_code=406, detail="msgpack is not installed on the server")
+        if count is None:
+            count = db.query(models.Product.id).filter(*criteria).count()
+        return StreamingResponse(_stream_msgpack_array(records, count),
+                                 media_type="application/msgpack", headers=headers)
     
-    return results
+    return StreamingResponse(_stream_json_array(records), media_type="application/json", headers=headers)
 
 
 @app.get("/forecasting/predictions/{product_id}")
@@ -0,0 +1,98 @@
+"""
+On-disk registry of fitted forecasting models (joblib artifacts + TrainedModel rows)
+"""
+import os
+import json
+import joblib
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from sqlalchemy.orm import Session
+import forecast_models
+
+MODEL_DIR = os.getenv(
+    "FORECAST_MODEL_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "model_registry")
+)
+
+# In-process copies of recently loaded artifacts, least recently used first:
+# path -> (mtime, model). Bounded so a large catalog's per-product models are
+# not all kept in memory between refreshes.
+MODEL_CACHE_SIZE = int(os.getenv("FORECAST_MODEL_CACHE_SIZE", "32"))
+_loaded_models = OrderedDict()
+_loaded_models_lock = threading.Lock()
+
+
+def artifact_path(product_id: int = None) -> str:
+    """
+    Artifact file for a product's model, or for the global model when product_id is None
+    """
+    name = f"product_{product_id}" if product_id is not None else "global"
+    return os.path.join(MODEL_DIR, f"{name}.joblib")
+
+
+def save_model(model, path: str):
+    """
+    Write a fitted model atomically (safe to call from pool workers)
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    joblib.dump(model, tmp_path)
+    os.replace(tmp_path, path)
+
+
+def load_model(path: str):
+    """
+    Load a saved model, reusing the in-process copy while the file is unchanged
+    """
+    mtime = os.path.getmtime(path)
+    with _loaded_models_lock:
+        cached = _loaded_models.get(path)
+        if cached and cached[0] == mtime:
+            _loaded_models.move_to_end(path)
+            return cached[1]
+    model = joblib.load(path)
+    with _loaded_models_lock:
+        _loaded_models[path] = (mtime, model)
+        _loaded_models.move_to_end(path)
+        while len(_loaded_models) > MODEL_CACHE_SIZE:
+            _loaded_models.popitem(last=False)
+    return model
+
+
+def register_models(db: Session, entries, global_model: bool = False):
+    """
+    Record freshly saved artifacts. Each entry is a dict with product_id
+    (None for the global model), model_name, artifact_path, features,
+    train_start, train_end, metrics and optional settings and watermark
+    ((last order_item id, units sold) at training time). The registry only
+    keeps the models of the latest training mode. Does not commit.
+    """
+    TrainedModel = forecast_models.TrainedModel
+    if global_model:
+        db.query(TrainedModel).filter(TrainedModel.product_id.isnot(None)).delete(synchronize_session=False)
+    else:
+        db.query(TrainedModel).filter(TrainedModel.product_id.is_(None)).delete(synchronize_session=False)
+    
+    records = {r.product_id: r for r in db.query(TrainedModel).all()}
+    for entry in entries:
+        record = records.get(entry['product_id'])
+        if record is None:
+            record = TrainedModel(product_id=entry['product_id'])
+            db.add(record)
+        record.model_name = entry['model_name']
+        record.artifact_path = entry['artifact_path']
+        record.features = json.dumps(entry['features'])
+        record.train_start = entry['train_start']
+        record.train_end = entry['train_end']
+        record.metrics = json.dumps(entry['metrics'])
+        record.settings = json.dumps(entry.get('settings') or {})
+        record.last_order_item_id, record.units_sold = entry.get('watermark') or (None, None)
+        record.trained_at = datetime.utcnow()
+
+
+def get_registered_models(db: Session) -> dict:
+    """
+    Registered models keyed by product_id (None = global model)
+    """
+    return {r.product_id: r for r in db.query(forecast_models.TrainedModel).all()}
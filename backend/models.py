@@ -1,4 +1,4 @@
-from sqlalchemy import Boolean, Column, ForeignKey, Integer, String, Float, DateTime
+from sqlalchemy import Boolean, Column, ForeignKey, Integer, String, Float, DateTime, Index
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from database import Base
@@ -35,18 +35,32 @@ class Order(Base):
     shipping_address = Column(String)
     total_amount = Column(Float)
     status = Column(String, default="pending")
-    created_at = Column(DateTime, default=datetime.utcnow)
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
 
     items = relationship("OrderItem", back_populates="order")
 
+    # Filtered order listings walk these newest-id-first
+    __table_args__ = (
+        Index("ix_orders_status_id", "status", "id"),
+        Index("ix_orders_customer_email_id", "customer_email", "id"),
+    )
+
 class OrderItem(Base):
     __tablename__ = "order_items"
 
     id = Column(Integer, primary_key=True, index=True)
     order_id = Column(Integer, ForeignKey("orders.id"))
-    product_id = Column(Integer, ForeignKey("products.id"))
+    product_id = Column(Integer, ForeignKey("products.id"), index=True)
     quantity = Column(Integer)
     price_at_purchase = Column(Float)
 
     order = relationship("Order", back_populates="items")
     product = relationship("Product")
+
+class DashboardMetric(Base):
+    """Running total shown on the admin dashboard (see dashboard_metrics)"""
+    __tablename__ = "dashboard_metrics"
+
+    id = Column(Integer, primary_key=True, index=True)
+    name = Column(String, unique=True, index=True)  # 'total_sales', 'total_orders', 'total_products', 'monthly_sales:YYYY-MM'
+    value = Column(Float, default=0)
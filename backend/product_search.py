@@ -0,0 +1,116 @@
+"""
+In-process BM25 index over the product catalog, used to pick the products
+that go into the chatbot prompt (no external service needed)
+"""
+import math
+import re
+import heapq
+from collections import Counter, defaultdict
+
+# Term weight per field: a match in the name counts more than one in the description
+FIELD_WEIGHTS = {"name": 3, "category": 2, "description": 1}
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+STOPWORDS = {
+    "a", "an", "and", "are", "do", "does", "for", "have", "hai", "hain", "how", "i", "in", "is",
+    "it", "ka", "ke", "ki", "kya", "me", "mein", "of", "on", "or", "the", "to", "what", "with", "you"
+}
+
+
+def tokenize(text: str) -> list:
+    """Lowercase word tokens without stopwords, with a plural 's' stripped"""
+    tokens = []
+    for token in re.findall(r"[a-z0-9]+", (text or "").lower()):
+        if token in STOPWORDS:
+            continue
+        if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+            token = token[:-1]
+        tokens.append(token)
+    return tokens
+
+
+class ProductIndex:
+    """
+    BM25 inverted index over product name/category/description plus a
+    precomputed price-range summary. products are
+    (name, price, category, stock_quantity, description) tuples.
+    """
+
+    def __init__(self, products):
+        self.lines = []  # Rendered prompt line(s) per product
+        self.in_stock = []
+        self.postings = defaultdict(list)  # term -> [(doc, weighted tf)]
+        lengths = []
+        for doc, (name, price, category, stock_quantity, description) in enumerate(products):
+            status = "✅ In Stock" if stock_quantity > 0 else "❌ Out of Stock"
+            self.lines.append(f"• {name} - ${price} | Category: {category} | {status}\n"
+                              f"  Description: {description}\n")
+            self.in_stock.append(stock_quantity > 0)
+
+            counts = Counter()
+            for field, text in (("name", name), ("category", category), ("description", description)):
+                for token in tokenize(text):
+                    counts[token] += FIELD_WEIGHTS[field]
+            for term, tf in counts.items():
+                self.postings[term].append((doc, tf))
+            lengths.append(sum(counts.values()))
+
+        self.lengths = lengths
+        self.avg_length = (sum(lengths) / len(lengths)) if lengths else 0
+        n = len(lengths)
+        self.idf = {term: math.log(1 + (n - len(docs) + 0.5) / (len(docs) + 0.5))
+                    for term, docs in self.postings.items()}
+        self.summary = self._summarize(products)
+
+    def __len__(self):
+        return len(self.lines)
+
+    @staticmethod
+    def _summarize(products) -> str:
+        if not products:
+            return "No products available at the moment.\n"
+
+        prices = [p[1] for p in products]
+        by_category = defaultdict(list)
+        for name, price, category, stock_quantity, description in products:
+            by_category[category].append(price)
+
+        lines = [f"**Catalog Summary:** {len(products)} products, "
+                 f"{sum(1 for p in products if p[3] > 0)} in stock, "
+                 f"prices from ${min(prices)} to ${max(prices)}\n"]
+        for category in sorted(by_category, key=str):
+            category_prices = by_category[category]
+            lines.append(f"• {category}: {len(category_prices)} products, "
+                         f"${min(category_prices)} - ${max(category_prices)}\n")
+        return "".join(lines)
+
+    def search(self, query: str, k: int) -> list:
+        """Indices of the k best BM25 matches for query (fewer if fewer products match)"""
+        scores = defaultdict(float)
+        for term in set(tokenize(query)):
+            idf = self.idf.get(term)
+            if idf is None:
+                continue
+            for doc, tf in self.postings[term]:
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * self.lengths[doc] / self.avg_length)
+                scores[doc] += idf * tf * (BM25_K1 + 1) / (tf + norm)
+        return heapq.nlargest(k, scores, key=lambda doc: (scores[doc], -doc))
+
+    def context(self, query: str, k: int) -> str:
+        """
+        Prompt block: the catalog summary plus the k products most relevant
+        to query (in-stock products first when nothing matches)
+        """
+        if not self.lines:
+            return self.summary
+        if len(self.lines) <= k:
+            docs = range(len(self.lines))
+        else:
+            docs = self.search(query, k)
+            if len(docs) < k:
+                # Pad with in-stock products so general questions still get examples
+                chosen = set(docs)
+                fill = [d for d in range(len(self.lines)) if self.in_stock[d] and d not in chosen]
+                docs = list(docs) + fill[:k - len(docs)]
+        return self.summary + "\n**Relevant Products:**\n" + "".join(self.lines[d] for d in docs)
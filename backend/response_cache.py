@@ -0,0 +1,68 @@
+"""
+In-process TTL + LRU cache of rendered JSON responses, with ETags
+"""
+import os
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+
+class ResponseCache:
+    """Rendered response bodies by key, dropped after ttl seconds or when least recently used"""
+
+    def __init__(self, max_entries: int = 256, ttl: float = 60):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.version = 0  # Bumped by invalidate(); bodies built before that are not stored
+        self._entries = OrderedDict()  # key -> (expires_at, body, etag)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """(body, etag) for a fresh entry, or None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[1], entry[2]
+
+    def set(self, key, body: bytes, version: int) -> str:
+        """
+        Store body under key and return its ETag. version is self.version read
+        before the body was built: if the cache was invalidated meanwhile the
+        body may be stale, so it is returned to the caller but not stored.
+        """
+        etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+        with self._lock:
+            if version == self.version:
+                self._entries[key] = (time.monotonic() + self.ttl, body, etag)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return etag
+
+    def invalidate(self):
+        """Drop every entry (call after writes that change what was cached)"""
+        with self._lock:
+            self.version += 1
+            self._entries.clear()
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """Whether an If-None-Match header value covers etag"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return etag in [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+
+
+# Storefront product listings and details; cleared by the product and order CRUD paths
+catalog_cache = ResponseCache(
+    max_entries=int(os.getenv("CATALOG_CACHE_SIZE", "256")),
+    ttl=float(os.getenv("CATALOG_CACHE_TTL", "60"))
+)
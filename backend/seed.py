@@ -5,7 +5,7 @@ import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from backend.database import SessionLocal, engine
-from backend import models, schemas, crud
+from backend import models, schemas, crud, dashboard_metrics
 
 # Create tables if they don't exist
 models.Base.metadata.create_all(bind=engine)
@@ -85,6 +85,8 @@ def seed_data():
     else:
         print("Admin user already exists.")
 
+    # Rebuild the admin dashboard totals from what was just seeded
+    dashboard_metrics.reconcile(db)
     db.close()
 
 if __name__ == "__main__":
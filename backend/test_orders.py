@@ -0,0 +1,56 @@
+import sys
+import os
+
+# Backend modules import each other by bare name (import models, ...)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import pytest
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+import models, crud
+
+
+@pytest.fixture
+def engine():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    models.Base.metadata.create_all(bind=engine)
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture
+def db(engine):
+    session = sessionmaker(autocommit=False, autoflush=False, bind=engine)()
+    product = models.Product(name="Widget", description="", price=5.0, stock_quantity=1000, category="Misc")
+    session.add(product)
+    session.flush()
+    for n in range(120):
+        order = models.Order(customer_name=f"Customer {n}", customer_email=f"c{n}@example.com",
+                             shipping_address="1 Main St", total_amount=10.0)
+        order.items = [models.OrderItem(product_id=product.id, quantity=1, price_at_purchase=5.0)
+                       for _ in range(2)]
+        session.add(order)
+    session.commit()
+    yield session
+    session.close()
+
+
+def test_order_page_loads_items_in_two_statements(engine, db):
+    statements = []
+
+    def count(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    db.expire_all()
+    event.listen(engine, "before_cursor_execute", count)
+    try:
+        orders = crud.get_orders(db, limit=100)
+        item_count = sum(len(order.items) for order in orders)
+    finally:
+        event.remove(engine, "before_cursor_execute", count)
+
+    assert len(orders) == 100
+    assert item_count == 200
+    assert len(statements) == 2, statements
@@ -0,0 +1,112 @@
+"""
+In-process background jobs for forecasting retrains
+"""
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from database import SessionLocal
+import forecasting
+
+MAX_KEPT_JOBS = 20
+
+# One retrain at a time; later requests queue behind it
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="forecast-train")
+_jobs = OrderedDict()
+_lock = threading.Lock()
+
+
+class TrainingJob:
+    """Status and progress of one train_all_products run"""
+
+    def __init__(self, workers: int = None, mode: str = None, full: bool = False):
+        self.id = uuid.uuid4().hex
+        self.workers = workers
+        self.mode = mode
+        self.full = full
+        self.status = "queued"  # 'queued', 'running', 'completed', 'failed'
+        self.created_at = datetime.utcnow()
+        self.started_at = None
+        self.finished_at = None
+        self.total = 0
+        self.done = 0
+        self.durations = {}  # product_id -> training seconds
+        self.products_trained = 0
+        self.error = None
+        self._started = None
+        self._finished = None
+
+    # Progress reporter interface used by forecasting.train_all_products
+    def set_total(self, total: int):
+        self.total = total
+
+    def product_done(self, product_id: int, seconds: float):
+        with _lock:
+            self.done += 1
+            self.durations[product_id] = round(seconds, 3)
+
+    def to_dict(self) -> dict:
+        elapsed = None
+        eta = None
+        if self._started is not None:
+            elapsed = (time.monotonic() if self.finished_at is None else self._finished) - self._started
+            if self.status == "running" and self.done:
+                eta = elapsed / self.done * (self.total - self.done)
+        with _lock:
+            durations = dict(self.durations)
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "mode": self.mode,
+            "workers": self.workers,
+            "full": self.full,
+            "products_done": self.done,
+            "products_total": self.total,
+            "products_trained": self.products_trained,
+            "elapsed_seconds": round(elapsed, 1) if elapsed is not None else None,
+            "eta_seconds": round(eta, 1) if eta is not None else None,
+            "product_durations": durations,
+            "error": self.error,
+            "created_at": self.created_at.isoformat(),
+            "started_at": self.started_at.isoformat() if self.started_at else None,
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None
+        }
+
+    def run(self):
+        self.status = "running"
+        self.started_at = datetime.utcnow()
+        self._started = time.monotonic()
+        db = SessionLocal()
+        try:
+            results = forecasting.train_all_products(db, workers=self.workers, mode=self.mode,
+                                                     progress=self, full=self.full)
+            self.products_trained = len(results)
+            self.status = "completed"
+        except Exception as e:
+            print(f"[ERROR] training job {self.id}: {e}")
+            self.error = str(e)
+            self.status = "failed"
+        finally:
+            db.close()
+            self._finished = time.monotonic()
+            self.finished_at = datetime.utcnow()
+
+
+def submit(workers: int = None, mode: str = None, full: bool = False) -> TrainingJob:
+    """
+    Queue a retrain on the background worker and return its job
+    """
+    job = TrainingJob(workers=workers, mode=mode, full=full)
+    with _lock:
+        _jobs[job.id] = job
+        while len(_jobs) > MAX_KEPT_JOBS:
+            _jobs.popitem(last=False)
+    _executor.submit(job.run)
+    return job
+
+
+def get(job_id: str) -> TrainingJob:
+    with _lock:
+        return _jobs.get(job_id)
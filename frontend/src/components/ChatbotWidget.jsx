@@ -1,6 +1,6 @@
 import React, { useState, useRef, useEffect } from 'react';
 import { MessageCircle, X, Send, Loader, Minimize2, Trash2, MoreVertical } from 'lucide-react';
-import api from '../lib/api';
+import { streamChatMessage } from '../lib/api';
 
 const ChatbotWidget = () => {
     const [isOpen, setIsOpen] = useState(false);
@@ -50,12 +50,26 @@ const ChatbotWidget = () => {
             inputRef.current?.focus();
         }, 0);
 
+        // The AI message appears with the first streamed chunk and grows as chunks arrive
+        const aiMsgId = Date.now() + 1;
+        let started = false;
         try {
-            const response = await api.post('/chat/message', { message: userMsg.text });
-            const aiResponseText = response.data.reply;
+            const reply = await streamChatMessage(userMsg.text, (delta) => {
+                if (!started) {
+                    started = true;
+                    setLoading(false);
+                    setMessages(prev => [...prev, { id: aiMsgId, text: delta, sender: 'ai' }]);
+                } else {
+                    setMessages(prev => prev.map(msg => msg.id === aiMsgId ? { ...msg, text: msg.text + delta } : msg));
+                }
+            });
 
-            const aiMsg = { id: Date.now() + 1, text: aiResponseText, sender: 'ai' };
-            setMessages(prev => [...prev, aiMsg]);
+            // Settle on the final (trimmed) reply
+            if (started) {
+                setMessages(prev => prev.map(msg => msg.id === aiMsgId ? { ...msg, text: reply } : msg));
+            } else {
+                setMessages(prev => [...prev, { id: aiMsgId, text: reply, sender: 'ai' }]);
+            }
 
         } catch (error) {
             console.error("Chat error", error);
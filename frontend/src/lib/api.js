@@ -7,4 +7,41 @@ const api = axios.create({
     },
 });
 
+// POST a chat message to the SSE endpoint and call onDelta(text) for each
+// chunk as it arrives; resolves with the full reply. Uses fetch because
+// axios does not expose the response stream in the browser.
+export const streamChatMessage = async (message, onDelta) => {
+    const response = await fetch(`${api.defaults.baseURL}/chat/stream`, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json', Accept: 'text/event-stream' },
+        body: JSON.stringify({ message }),
+    });
+    if (!response.ok || !response.body) throw new Error(`Chat stream failed: ${response.status}`);
+
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    let reply = '';
+    for (;;) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+
+        // Events are separated by a blank line
+        let boundary;
+        while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+            const lines = buffer.slice(0, boundary).split('\n');
+            buffer = buffer.slice(boundary + 2);
+            const event = lines.find(l => l.startsWith('event:'))?.slice(6).trim() || 'message';
+            const data = lines.filter(l => l.startsWith('data:')).map(l => l.slice(5).trim()).join('\n');
+            if (!data) continue;
+            const payload = JSON.parse(data);
+            if (event === 'done') return payload.reply;
+            reply += payload.delta;
+            onDelta(payload.delta);
+        }
+    }
+    return reply.trim();
+};
+
 export default api;
@@ -19,11 +19,14 @@ import {
 } from 'lucide-react';
 import './Forecasting.css';
 
+const PREDICTIONS_PAGE_SIZE = 200;
+
 const Forecasting = () => {
     const [predictions, setPredictions] = useState([]);
     const [alerts, setAlerts] = useState([]);
     const [loading, setLoading] = useState(true);
     const [training, setTraining] = useState(false);
+    const [trainingProgress, setTrainingProgress] = useState(null);
     const [selectedProduct, setSelectedProduct] = useState(null);
     const [productTrends, setProductTrends] = useState(null);
 
@@ -41,13 +44,21 @@ const Forecasting = () => {
 
         try {
             if (!silent) setLoading(true);
-            const [predsRes, alertsRes] = await Promise.all([
-                axios.get('http://localhost:8000/forecasting/predictions'),
-                axios.get('http://localhost:8000/forecasting/alerts')
-            ]);
-
-            if (predsRes.data) setPredictions(predsRes.data);
+            const alertsRes = await axios.get('http://localhost:8000/forecasting/alerts');
             if (alertsRes.data) setAlerts(alertsRes.data);
+
+            // Load predictions page by page, showing the first page as soon as it arrives
+            let loaded = [];
+            let cursor = null;
+            do {
+                const res = await axios.get('http://localhost:8000/forecasting/predictions', {
+                    params: { limit: PREDICTIONS_PAGE_SIZE, ...(cursor && { after_id: cursor }) }
+                });
+                loaded = loaded.concat(res.data);
+                cursor = res.headers['x-next-cursor'];
+                if (!cursor || !silent) setPredictions(loaded);
+                if (!silent) setLoading(false);
+            } while (cursor);
         } catch (error) {
             console.error('Error fetching forecasting data:', error);
         } finally {
@@ -59,12 +70,24 @@ const Forecasting = () => {
     const trainModels = async () => {
         try {
             setTraining(true);
-            await axios.post('http://localhost:8000/forecasting/train');
+            const { data } = await axios.post('http://localhost:8000/forecasting/train');
+
+            // Training runs as a background job; poll until it finishes
+            let job = data;
+            while (job.status === 'queued' || job.status === 'running') {
+                await new Promise(resolve => setTimeout(resolve, 2000));
+                job = (await axios.get(`http://localhost:8000/forecasting/jobs/${data.job_id}`)).data;
+                if (job.products_total) {
+                    setTrainingProgress(Math.round((job.products_done / job.products_total) * 100));
+                }
+            }
+            if (job.status === 'failed') console.error('Training job failed:', job.error);
             fetchData();
         } catch (error) {
             console.error('Error training models:', error);
         } finally {
             setTraining(false);
+            setTrainingProgress(null);
         }
     };
 
@@ -118,7 +141,9 @@ const Forecasting = () => {
                         disabled={training}
                     >
                         <RefreshCw className={training ? 'spin' : ''} size={18} />
-                        {training ? 'Calculating Intelligence...' : 'Sync Data Engine'}
+                        {training
+                            ? `Calculating Intelligence...${trainingProgress !== null ? ` ${trainingProgress}%` : ''}`
+                            : 'Sync Data Engine'}
                     </button>
                 </div>
             </header>